@@ -0,0 +1,100 @@
+# benchmark_ocr.py - Compare per-page OCR latency of the available backends
+# Usage: python benchmark_ocr.py [--pages 5] [--dpi 200] [pdf ...]
+#
+# Renders pages from the sample PDFs in documents/ once, then runs the same
+# images through every installed OCR backend (see OCR_BACKEND in ocr_engines.py).
+
+import argparse
+import glob
+import statistics
+import sys
+import time
+
+from ocr_engines import OCR_AVAILABLE, OCR_DPI, TESSEROCR_AVAILABLE, create_ocr_engine
+
+try:
+    from pdf2image import convert_from_path
+except ImportError:
+    print("ERROR: pdf2image not installed. Run: pip install pdf2image")
+    sys.exit(1)
+
+
+def render_samples(paths, pages, dpi):
+    images = []
+    for path in paths:
+        try:
+            rendered = convert_from_path(path, dpi=dpi, first_page=1, last_page=pages)
+        except Exception as e:
+            print(f" [WARN] Could not render {path}: {e}")
+            continue
+        images.extend(rendered)
+        print(f" [OK] {path}: {len(rendered)} pages")
+    return images
+
+
+def benchmark(backend, images):
+    started = time.perf_counter()
+    engine = create_ocr_engine(backend)
+    init_s = time.perf_counter() - started
+    if engine.name != backend:
+        return None
+
+    latencies = []
+    for image in images:
+        t0 = time.perf_counter()
+        engine.recognize(image)
+        latencies.append(time.perf_counter() - t0)
+    return {
+        "init_ms": init_s * 1000,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "median_ms": statistics.median(latencies) * 1000,
+        "total_s": sum(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OCR backends on sample PDFs")
+    parser.add_argument("pdfs", nargs="*", help="PDFs to render (default: documents/*.pdf)")
+    parser.add_argument("--pages", type=int, default=5, help="Pages per PDF")
+    parser.add_argument("--dpi", type=int, default=OCR_DPI)
+    args = parser.parse_args()
+
+    if not OCR_AVAILABLE:
+        print("ERROR: OCR not available. Run: pip install pytesseract pdf2image pillow")
+        sys.exit(1)
+
+    paths = args.pdfs or sorted(glob.glob("documents/*.pdf"))
+    print("=" * 60)
+    print(f"OCR benchmark - {len(paths)} PDFs, up to {args.pages} pages each @ {args.dpi} DPI")
+    print("=" * 60)
+    images = render_samples(paths, args.pages, args.dpi)
+    if not images:
+        print("ERROR: nothing to benchmark")
+        sys.exit(1)
+
+    backends = ["pytesseract"]
+    if TESSEROCR_AVAILABLE:
+        backends.append("tesserocr")
+    else:
+        print("\n[INFO] tesserocr not installed; only pytesseract will be measured")
+
+    results = {}
+    for backend in backends:
+        print(f"\n[..] {backend}: {len(images)} pages")
+        results[backend] = benchmark(backend, images)
+
+    print()
+    print(f"{'backend':<14}{'init ms':>10}{'mean ms/page':>15}{'median ms':>12}{'total s':>10}")
+    for backend, r in results.items():
+        if r is None:
+            print(f"{backend:<14}{'unavailable':>10}")
+            continue
+        print(f"{backend:<14}{r['init_ms']:>10.0f}{r['mean_ms']:>15.0f}{r['median_ms']:>12.0f}{r['total_s']:>10.1f}")
+
+    if results.get("tesserocr") and results.get("pytesseract"):
+        speedup = results["pytesseract"]["mean_ms"] / results["tesserocr"]["mean_ms"]
+        print(f"\nResident engine speedup: {speedup:.2f}x per page")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+# migrate_vectors.py - Maintenance commands for the vector tables and the policy index
+# Usage: python migrate_vectors.py quantize [--batch 500] [--force]
+#        EMBEDDING_DIM=256 python migrate_vectors.py reembed [--batch 64]
+#        python migrate_vectors.py index [--force]
+#
+# quantize: backfill claims_vec_q8 (int8 codes used when DUPLICATE_QUANTIZED_INDEX=1)
+#           from the float vectors already stored in claims_vec.
+# reembed:  recreate claims_vec / exclusions_vec at the configured EMBEDDING_DIM and
+#           refill them from claims.diagnosis and the exclusions table. Texts found in
+#           embedding_cache at full size are truncated locally instead of re-embedded.
+# index:    sync policy_index/ with documents/ ahead of time (parallel parse, batched
+#           embeds, progress in chunks/s); --force rebuilds it from scratch.
+
+import argparse
+import sqlite3
+import struct
+import sys
+import time
+
+import numpy as np
+
+try:
+    import sqlite_vec
+except ImportError:
+    print("ERROR: sqlite-vec not installed. Run: pip install sqlite-vec")
+    sys.exit(1)
+
+from optimized_app_fixed import (
+    DB_PATH,
+    EMBEDDING_MODEL,
+    EXPECTED_EMBEDDING_DIM,
+    POLICY_INDEX_DIR,
+    _normalize_embedding_text,
+    fit_embedding_dim,
+    ollama_embed,
+    quantize_int8,
+    serialize_f32,
+    sync_policy_index,
+)
+
+
+def connect():
+    conn = sqlite3.connect(DB_PATH)
+    conn.enable_load_extension(True)
+    sqlite_vec.load(conn)
+    conn.enable_load_extension(False)
+    return conn
+
+
+def quantize(conn, batch_size, force):
+    cursor = conn.cursor()
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS claims_vec_q8 (
+        claim_id TEXT PRIMARY KEY,
+        code BLOB NOT NULL
+    )
+    """)
+    if force:
+        cursor.execute("DELETE FROM claims_vec_q8")
+    done = {row[0] for row in cursor.execute("SELECT claim_id FROM claims_vec_q8")}
+
+    total = cursor.execute("SELECT COUNT(*) FROM claims_vec").fetchone()[0]
+    print(f"[..] {total} claim vectors, {len(done)} already quantized")
+
+    started = time.perf_counter()
+    written = skipped = 0
+    batch = []
+    for claim_id, blob in conn.execute("SELECT claim_id, diagnosis_embedding FROM claims_vec"):
+        if claim_id in done:
+            continue
+        vector = struct.unpack(f"{len(blob) // 4}f", blob)
+        if len(vector) != EXPECTED_EMBEDDING_DIM:
+            print(f" [WARN] {claim_id}: {len(vector)} dimensions, skipped")
+            skipped += 1
+            continue
+        batch.append((claim_id, quantize_int8(vector)))
+        if len(batch) >= batch_size:
+            cursor.executemany("INSERT OR REPLACE INTO claims_vec_q8 (claim_id, code) VALUES (?, ?)", batch)
+            conn.commit()
+            written += len(batch)
+            batch = []
+            print(f" [OK] {written} written")
+    if batch:
+        cursor.executemany("INSERT OR REPLACE INTO claims_vec_q8 (claim_id, code) VALUES (?, ?)", batch)
+        conn.commit()
+        written += len(batch)
+
+    elapsed = time.perf_counter() - started
+    print(f"[OK] Quantized {written} vectors in {elapsed:.1f}s ({skipped} skipped)")
+    print(f"     Storage: {written * EXPECTED_EMBEDDING_DIM / 1024:.0f} KB int8 "
+          f"vs {written * EXPECTED_EMBEDDING_DIM * 4 / 1024:.0f} KB float32")
+    if written:
+        check_recall(conn)
+
+
+def embed_all(conn, texts, batch_size):
+    """
+    Vectors for texts at EXPECTED_EMBEDDING_DIM, from embedding_cache where possible.
+    Newly embedded texts are cached at native size, like get_embedding does.
+    """
+    vectors, missing = {}, []
+    for text in dict.fromkeys(texts):
+        row = conn.execute(
+            "SELECT vector FROM embedding_cache WHERE model = ? AND text = ?", (EMBEDDING_MODEL, text)
+        ).fetchone()
+        if row and len(row[0]) // 4 >= EXPECTED_EMBEDDING_DIM:
+            vectors[text] = fit_embedding_dim(struct.unpack(f"{len(row[0]) // 4}f", row[0]))
+        else:
+            missing.append(text)
+    print(f"[..] {len(vectors)} texts from embedding_cache, {len(missing)} to embed")
+
+    for i in range(0, len(missing), batch_size):
+        batch = missing[i:i + batch_size]
+        response = ollama_embed(EMBEDDING_MODEL, batch)
+        rows = []
+        for text, vector in zip(batch, response["embeddings"]):
+            vectors[text] = fit_embedding_dim(vector)
+            rows.append((EMBEDDING_MODEL, text, struct.pack(f"{len(vector)}f", *vector)))
+        conn.executemany("INSERT OR REPLACE INTO embedding_cache (model, text, vector) VALUES (?, ?, ?)", rows)
+        conn.commit()
+        print(f" [OK] {min(i + batch_size, len(missing))}/{len(missing)} embedded")
+    return vectors
+
+
+def reembed(conn, batch_size):
+    cursor = conn.cursor()
+    started = time.perf_counter()
+
+    claims = cursor.execute("SELECT id, diagnosis FROM claims WHERE diagnosis IS NOT NULL AND diagnosis != ''").fetchall()
+    exclusions = cursor.execute("SELECT id, name, description FROM exclusions").fetchall()
+    claim_texts = {claim_id: _normalize_embedding_text(diagnosis.lower()) for claim_id, diagnosis in claims}
+    exclusion_texts = {
+        excl_id: _normalize_embedding_text(f"{name}: {description}") for excl_id, name, description in exclusions
+    }
+    vectors = embed_all(conn, list(claim_texts.values()) + list(exclusion_texts.values()), batch_size)
+
+    # Embedding first, DDL last: a failed embed leaves the old tables untouched
+    cursor.execute("DROP TABLE IF EXISTS claims_vec")
+    cursor.execute("DROP TABLE IF EXISTS exclusions_vec")
+    cursor.execute(f"""
+    CREATE VIRTUAL TABLE claims_vec USING vec0(
+        claim_id TEXT PRIMARY KEY,
+        diagnosis_embedding float[{EXPECTED_EMBEDDING_DIM}]
+    )
+    """)
+    cursor.execute(f"""
+    CREATE VIRTUAL TABLE exclusions_vec USING vec0(
+        exclusion_id INTEGER PRIMARY KEY,
+        embedding float[{EXPECTED_EMBEDDING_DIM}]
+    )
+    """)
+    cursor.executemany(
+        "INSERT INTO claims_vec (claim_id, diagnosis_embedding) VALUES (?, ?)",
+        [(claim_id, serialize_f32(vectors[text])) for claim_id, text in claim_texts.items()],
+    )
+    cursor.executemany(
+        "INSERT INTO exclusions_vec (exclusion_id, embedding) VALUES (?, ?)",
+        [(excl_id, serialize_f32(vectors[text])) for excl_id, text in exclusion_texts.items()],
+    )
+    conn.commit()
+
+    elapsed = time.perf_counter() - started
+    print(f"[OK] {len(claim_texts)} claims and {len(exclusion_texts)} exclusions at "
+          f"{EXPECTED_EMBEDDING_DIM}-d in {elapsed:.1f}s")
+
+    has_codes = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'claims_vec_q8'"
+    ).fetchone() and cursor.execute("SELECT 1 FROM claims_vec_q8 LIMIT 1").fetchone()
+    if has_codes:
+        print("[..] Rebuilding int8 codes")
+        quantize(conn, 500, force=True)
+    print(f"[NOTE] {POLICY_INDEX_DIR}/ is rebuilt at this size on the next app start")
+
+
+def check_recall(conn, samples=200):
+    """Spot-check that int8 cosine tracks float cosine on stored rows."""
+    rows = conn.execute(
+        """
+        SELECT v.diagnosis_embedding, q.code FROM claims_vec_q8 q
+        JOIN (SELECT claim_id, diagnosis_embedding FROM claims_vec) v ON v.claim_id = q.claim_id
+        LIMIT ?
+        """,
+        (samples,),
+    ).fetchall()
+    if len(rows) < 2:
+        return
+    floats = np.vstack([np.frombuffer(r[0], dtype=np.float32) for r in rows])
+    codes = np.vstack([np.frombuffer(r[1], dtype=np.int8) for r in rows]).astype(np.float32)
+    floats /= np.linalg.norm(floats, axis=1, keepdims=True)
+    codes /= np.linalg.norm(codes, axis=1, keepdims=True)
+    error = np.abs(floats @ floats[0] - codes @ codes[0]).max()
+    print(f"[VERIFY] Max cosine error vs float over {len(rows)} rows: {error:.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain claim vector tables")
+    sub = parser.add_subparsers(dest="command", required=True)
+    q = sub.add_parser("quantize", help="Backfill int8 codes into claims_vec_q8")
+    q.add_argument("--batch", type=int, default=500, help="Rows per commit")
+    q.add_argument("--force", action="store_true", help="Rebuild all codes")
+    r = sub.add_parser("reembed", help="Rebuild vector tables at EMBEDDING_DIM")
+    r.add_argument("--batch", type=int, default=64, help="Texts per embed request")
+    i = sub.add_parser("index", help="Sync the policy index with documents/")
+    i.add_argument("--force", action="store_true", help="Rebuild the index from scratch")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"ClaimTrackr — Vector migration: {args.command}")
+    print("=" * 60)
+    if args.command == "index":
+        summary = sync_policy_index(force=args.force)
+        print(f"[OK] Policy index v{summary['version']}: {summary['chunks']} chunks, "
+              f"{len(summary['added'])} PDFs embedded, {summary['removed_chunks']} chunks removed "
+              f"in {summary['seconds']}s")
+        return
+
+    conn = connect()
+    try:
+        if args.command == "quantize":
+            quantize(conn, args.batch, args.force)
+        elif args.command == "reembed":
+            reembed(conn, args.batch)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# ocr_engines.py - Tesseract backends shared by the app's OCR workers and benchmark_ocr.py
+# Kept free of Flask/app imports so tools can load the engines without starting the app.
+
+import importlib.util
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+OCR_AVAILABLE = all(importlib.util.find_spec(name) for name in ("pytesseract", "pdf2image"))
+
+# Optional resident Tesseract engine (C API bindings): pip install tesserocr
+TESSEROCR_AVAILABLE = importlib.util.find_spec("tesserocr") is not None
+
+OCR_DPI = 200  # Rasterization DPI for OCR/vision (lowered per page to respect the budget)
+OCR_BACKEND = "auto"  # "tesserocr", "pytesseract", or "auto" (tesserocr when installed)
+OCR_LANG = "eng"
+
+
+class PytesseractEngine:
+    """Spawns a tesseract process per page; always available when OCR is installed."""
+    name = "pytesseract"
+
+    def recognize(self, image) -> str:
+        import pytesseract
+        return pytesseract.image_to_string(image, lang=OCR_LANG)
+
+
+class TesserocrEngine:
+    """Resident Tesseract via the C API: language data is loaded once and reused for every page."""
+    name = "tesserocr"
+
+    def __init__(self):
+        import tesserocr
+        self._api = tesserocr.PyTessBaseAPI(lang=OCR_LANG)
+        self._lock = threading.Lock()
+
+    def recognize(self, image) -> str:
+        with self._lock:
+            self._api.SetImage(image)
+            return self._api.GetUTF8Text()
+
+
+def select_ocr_backend(backend: str = None) -> str:
+    """Name of the engine create_ocr_engine builds for backend, without loading it."""
+    backend = backend or OCR_BACKEND
+    if backend in ("auto", "tesserocr") and TESSEROCR_AVAILABLE:
+        return "tesserocr"
+    return "pytesseract"
+
+
+def create_ocr_engine(backend: str = None):
+    """Build the configured OCR backend, falling back to pytesseract when unavailable."""
+    backend = backend or OCR_BACKEND
+    if select_ocr_backend(backend) == "tesserocr":
+        try:
+            return TesserocrEngine()
+        except Exception as e:
+            logger.warning(f"tesserocr unavailable ({e}), falling back to pytesseract")
+    elif backend == "tesserocr":
+        logger.warning("OCR_BACKEND=tesserocr but tesserocr is not installed, falling back to pytesseract")
+    return PytesseractEngine()
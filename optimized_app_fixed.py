@@ -11,42 +11,63 @@ import sqlite3
 import logging
 import threading
 import tempfile
+import shutil
 import base64
+import hashlib
+import math
+import queue
+import random
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
 import magic  # NEW: pip install python-magic-bin (Windows) or python-magic (Linux/Mac)
+from collections import OrderedDict, deque
 from contextlib import contextmanager
+from functools import lru_cache
 from datetime import datetime, timedelta
 from decimal import Decimal, ROUND_HALF_UP
 from pathlib import Path
+from typing import List, Optional, TypedDict
 import io
+import importlib.util
+import socket
+
+_IMPORT_STARTED = time.perf_counter()  # Startup report: module import time is measured from here
+
+import numpy as np
 
 from flask import Flask, render_template, request, jsonify, Response, send_from_directory
 from flask_cors import CORS
 from flask_limiter import Limiter  # NEW: pip install flask-limiter
 from flask_limiter.util import get_remote_address
-from PyPDF2 import PdfReader
-from langchain_community.document_loaders import DirectoryLoader, PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import OllamaEmbeddings
 
-# NEW: OCR imports
-try:
-    import pytesseract
-    from pdf2image import convert_from_path
-    OCR_AVAILABLE = True
-except ImportError:
-    OCR_AVAILABLE = False
+# Heavy stacks (PyPDF2, langchain loaders/splitter, OCR, Pillow) are imported where they are
+# used and preloaded by the background warm-up, so importing this module stays fast.
+# Only their presence is checked here.
+from ocr_engines import OCR_AVAILABLE, OCR_DPI, create_ocr_engine, select_ocr_backend
+
+if not OCR_AVAILABLE:
     print("WARNING: pytesseract/pdf2image not installed. Scanned PDFs will not work.")
     print("Run: pip install pytesseract pdf2image pillow")
 
+PIL_AVAILABLE = importlib.util.find_spec("PIL") is not None
+
 try:
     import sqlite_vec
 except ImportError:
     sqlite_vec = None
 
 try:
-    from ollama import chat, embed
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+try:
+    import httpx
+    from ollama import Client as OllamaClient, ResponseError
     import requests as http_requests
+    from requests.adapters import HTTPAdapter
 except ImportError:
     raise ImportError("Run: pip install ollama requests")
 
@@ -64,6 +85,7 @@ file_handler = RotatingFileHandler(
 )
 file_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
 logger.addHandler(file_handler)
+logging.getLogger("ocr_engines").addHandler(file_handler)
 
 # ─── Flask App ──────────────────────────────────────────────────────────────
 app = Flask(__name__)
@@ -82,12 +104,71 @@ limiter = Limiter(
 OLLAMA_BASE_URL = "http://localhost:11434"
 MAIN_MODEL = "llama3.2"
 FAST_MODEL = "llama3.2"
+VISION_MODEL = "llama3.2-vision"
 EMBEDDING_MODEL = "nomic-embed-text"
-FAISS_PATH = "faiss_index"
+POLICY_INDEX_DIR = "policy_index"  # CURRENT pointer file + one v<N>/ directory per published version
+POLICY_INDEX_FORMAT = 3  # 1 was FAISS save_local, 2 a single faiss_index/ directory swapped in place
+POLICY_INDEX_POINTER = "CURRENT"
+POLICY_INDEX_KEEP_VERSIONS = 2  # Published versions kept on disk; other workers may still map the previous one
+POLICY_VECTORS_FILE = "vectors.npy"
+POLICY_NORMS_FILE = "norms.npy"
+POLICY_CHUNKS_FILE = "chunks.sqlite"
+DOCUMENTS_DIR = "documents"
 DB_PATH = "claimtrackr.db"
-CACHE_TTL_SECONDS = 300
 MAX_FILE_SIZE = 10 * 1024 * 1024
-EXPECTED_EMBEDDING_DIM = 768
+DECISION_KEEP_ALIVE = "30m"  # Keep MAIN_MODEL (and its cached prompt prefix) resident between claims
+EMBEDDING_NATIVE_DIM = 768  # nomic-embed-text output size
+EXPECTED_EMBEDDING_DIM = int(os.environ.get("EMBEDDING_DIM", str(EMBEDDING_NATIVE_DIM)))  # Matryoshka truncation, e.g. 256/512
+EXTRACTION_CACHE_MAX_ENTRIES = 5000  # LRU bound for the upload-hash extraction cache
+EXTRACTION_CACHE_SCHEMA = 3  # Bump when extraction prompts/parsing change
+OCR_WORKERS = max(1, min(4, os.cpu_count() or 1))  # Process pool size for per-page OCR
+OCR_MIN_DPI = 100
+VISION_MAX_SIDE = 1120  # llama3.2-vision tiles at 560px (max 2x2), larger inputs are downsampled anyway
+VISION_JPEG_QUALITY = 85
+VISION_MAX_CONCURRENCY = 2  # Simultaneous requests to VISION_MODEL across all claims
+VISION_PAGE_BUDGET = 6  # Max scanned pages sent to the vision model per document
+MODEL_CONCURRENCY = {  # Max simultaneous in-flight requests per model, across all threads
+    MAIN_MODEL: 4,
+    VISION_MODEL: VISION_MAX_CONCURRENCY,
+    EMBEDDING_MODEL: 8,
+}
+OLLAMA_TIMEOUTS = {"chat": 120, "vision": 180, "embed": 30, "health": 5}  # Seconds per operation
+OLLAMA_CONNECT_TIMEOUT = 5
+OLLAMA_MAX_RETRIES = 2  # Retries after the first attempt, for connection errors/timeouts/5xx
+OLLAMA_RETRY_BASE_DELAY = 0.5
+OLLAMA_POOL_SIZE = 16  # Keep-alive connections per operation client
+EMBED_BATCH_WINDOW_MS = 5  # How long the embedding batcher waits to coalesce concurrent requests
+EMBED_MAX_BATCH = 32
+EMBED_MAX_INFLIGHT_BATCHES = 2
+# Longest a caller waits on the batcher: its own batch plus one ahead of it, each through all retries
+EMBED_RESULT_TIMEOUT = 2 * (OLLAMA_MAX_RETRIES + 1) * (
+    OLLAMA_CONNECT_TIMEOUT + OLLAMA_TIMEOUTS["embed"] + OLLAMA_RETRY_BASE_DELAY * 2 ** OLLAMA_MAX_RETRIES
+)
+DUPLICATE_LOOKBACK_DAYS = int(os.environ.get("DUPLICATE_LOOKBACK_DAYS", "365"))  # Same-patient history window
+DUPLICATE_MAX_CANDIDATES = 500  # Cap on prefiltered rows ranked per duplicate check
+DUPLICATE_QUANTIZED_INDEX = os.environ.get("DUPLICATE_QUANTIZED_INDEX", "0") == "1"  # Coarse int8 pass over claims_vec_q8
+DUPLICATE_RERANK_K = 20  # Candidates re-scored against float vectors after the int8 pass
+EXCLUSION_SIMILARITY_THRESHOLD = 75  # Percent cosine similarity for an exclusion match
+EXCLUSION_INDEX_CHECK_SECONDS = 30  # How often to look for exclusion edits made by other workers
+EMBEDDING_LRU_SIZE = 4096  # In-process tier of the embedding cache (SQLite table is the second tier)
+EMBEDDING_CACHE_MAX_ENTRIES = 50000  # Row bound for the SQLite embedding_cache; oldest entries are evicted
+RENDER_WINDOW_PAGES = 2  # Pages rasterized per poppler call when streaming
+RENDER_MEMORY_BUDGET_MB = 256  # Hard cap on decoded page bitmaps in flight per request
+PAGE_TEXT_DENSITY_MIN = 0.5  # Text-layer chars per square inch for a page to count as digital
+PAGE_IMAGE_COVERAGE_MIN = 0.3  # Fraction of the page covered by images for it to count as scanned
+POLICY_CHUNK_SIZE = 1000
+POLICY_CHUNK_OVERLAP = 200
+POLICY_INDEX_CHECK_SECONDS = 60  # How often documents/ is checked for added/changed/removed PDFs
+POLICY_PARSE_WORKERS = max(1, min(4, os.cpu_count() or 1))  # Processes parsing/splitting PDFs during index builds
+POLICY_EMBED_BATCH = 64  # Chunks per embed request during index builds
+POLICY_EMBED_INFLIGHT = 4  # Embed requests in flight during index builds
+POLICY_CONTEXT_QUERIES = {  # Fixed retrievals materialized once per policy index version
+    "claim_approval": "What are the documents required for claim approval?",
+    "general_exclusions": "Give a list of all general exclusions",
+}
+CLAIM_CONTEXT_K = 4  # Chunks retrieved per claim diagnosis
+CLAIM_CONTEXT_TOKEN_BUDGET = 350  # Max tokens of diagnosis-specific policy text in the claim block
+CLAIM_CONTEXT_LRU_SIZE = 1024
 
 # NEW: Upload directory for audit trail
 UPLOAD_DIR = Path("uploads")
@@ -96,6 +177,43 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 # ─── Globals ────────────────────────────────────────────────────────────────
 cached_faiss_db = None
 _cache_lock = threading.Lock()
+_policy_manifest = None  # Manifest of the live index; None until the first sync
+_policy_index_build_lock = threading.Lock()
+_retired_policy_index = None  # Replaced index, closed at the next publish so in-flight searches can finish
+_policy_index_checked_at = 0.0
+_policy_contexts = None  # {"build": policy_index_build(), "contexts": {key: text}}
+_policy_contexts_lock = threading.Lock()
+_startup_report = {"import_ms": None, "listening_ms": None, "warm": False, "warmup_ms": {}}
+_warmup_thread = None
+_warmup_lock = threading.Lock()
+_claim_context_lru = OrderedDict()  # (diagnosis, icd10, index version) -> packed policy text
+_claim_context_lock = threading.Lock()
+_claim_context_stats = {"hits": 0, "misses": 0}
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+_ocr_engine = None
+_ocr_engine_lock = threading.Lock()
+_model_semaphores = {}
+_model_semaphores_lock = threading.Lock()
+_ollama_clients = {}
+_ollama_clients_lock = threading.Lock()
+_health_session = None
+_embedding_batchers = {}
+_embedding_batchers_lock = threading.Lock()
+_embedding_lru = OrderedDict()
+_embedding_lru_lock = threading.Lock()
+_embedding_cache_stats = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+_exclusion_index = None  # Immutable dict, replaced wholesale on rebuild
+_exclusion_index_lock = threading.Lock()
+_prompt_stats = {
+    "calls": 0, "prompt_tokens_est": 0,
+    "measured_calls": 0, "prefill_tokens": 0, "measured_prompt_tokens_est": 0,
+}
+_prompt_stats_lock = threading.Lock()
+_decision_engine_stats = {"rules": 0, "llm": 0}
+_decision_engine_lock = threading.Lock()
+_vision_executor = ThreadPoolExecutor(max_workers=4 * VISION_MAX_CONCURRENCY, thread_name_prefix="vision")
+_upload_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="upload")
 
 EXCLUSION_NAMES = [
     "HIV/AIDS", "Parkinson's disease", "Alzheimer's disease",
@@ -123,6 +241,90 @@ def get_db():
         conn.close()
 
 
+def run_migrations():
+    """Apply idempotent schema migrations for tables added after setup_db.py."""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        
+        # Auto-migration for ICD-10 code
+        cursor.execute("PRAGMA table_info(claims)")
+        columns = [col["name"] for col in cursor.fetchall()]
+        if columns and "icd10_code" not in columns:
+            cursor.execute("ALTER TABLE claims ADD COLUMN icd10_code TEXT")
+            print(" [MIGRATION] Added icd10_code column to claims table")
+        if columns and "decision_engine" not in columns:
+            cursor.execute("ALTER TABLE claims ADD COLUMN decision_engine TEXT")
+            print(" [MIGRATION] Added decision_engine column to claims table")
+        
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS extraction_cache (
+            content_hash TEXT PRIMARY KEY,
+            extractor_version TEXT NOT NULL,
+            bill_text TEXT NOT NULL,
+            bill_info TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_extraction_cache_used ON extraction_cache(last_used_at)"
+        )
+        
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS embedding_cache (
+            model TEXT NOT NULL,
+            text TEXT NOT NULL,
+            vector BLOB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (model, text)
+        )
+        """)
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embedding_cache_created ON embedding_cache(created_at)"
+        )
+        
+        # int8 codes for the optional coarse duplicate search (backfill: migrate_vectors.py quantize)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS claims_vec_q8 (
+            claim_id TEXT PRIMARY KEY,
+            code BLOB NOT NULL
+        )
+        """)
+        
+        # Duplicate detection prefilters on (patient, date) before ranking by vector
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_claims_patient_lower_date ON claims(LOWER(patient_name), date)"
+        )
+        conn.commit()
+
+
+def fit_embedding_dim(vector) -> list:
+    """
+    Truncate a native embedding to EXPECTED_EMBEDDING_DIM and L2-renormalize it
+    (nomic-embed-text is Matryoshka-trained, so the leading dimensions carry the signal).
+    Vectors already at the configured size pass through unchanged.
+    """
+    if len(vector) == EXPECTED_EMBEDDING_DIM:
+        return list(vector)
+    if len(vector) < EXPECTED_EMBEDDING_DIM:
+        raise ValueError(f"Expected at least {EXPECTED_EMBEDDING_DIM} dimensions, got {len(vector)}")
+    vec = np.asarray(vector[:EXPECTED_EMBEDDING_DIM], dtype=np.float32)
+    return (vec / max(float(np.linalg.norm(vec)), 1e-12)).tolist()
+
+
+def check_vector_schema():
+    """Warn when the vec0 tables were created for a different EMBEDDING_DIM."""
+    with get_db() as conn:
+        for table in ("claims_vec", "exclusions_vec"):
+            row = conn.execute("SELECT sql FROM sqlite_master WHERE name = ?", (table,)).fetchone()
+            match = re.search(r"float\[(\d+)\]", row["sql"] if row else "")
+            if match and int(match.group(1)) != EXPECTED_EMBEDDING_DIM:
+                logger.warning(
+                    f"{table} stores {match.group(1)}-d vectors but EMBEDDING_DIM={EXPECTED_EMBEDDING_DIM}; "
+                    f"run: python migrate_vectors.py reembed"
+                )
+
+
 def serialize_f32(vector):
     """Pack a float list into bytes for sqlite-vec with validation."""
     if len(vector) != EXPECTED_EMBEDDING_DIM:
@@ -130,82 +332,434 @@ def serialize_f32(vector):
     return struct.pack(f"{len(vector)}f", *vector)
 
 
+def quantize_int8(vector) -> bytes:
+    """
+    Symmetric per-vector int8 code (768 bytes instead of 3 KB). The scale is not stored:
+    cosine similarity is scale-invariant, which is all the coarse pass needs.
+    """
+    vec = np.asarray(vector, dtype=np.float32)
+    if vec.shape != (EXPECTED_EMBEDDING_DIM,):
+        raise ValueError(f"Expected {EXPECTED_EMBEDDING_DIM} dimensions, got {vec.size}")
+    scale = float(np.abs(vec).max()) / 127 or 1.0
+    return np.clip(np.rint(vec / scale), -127, 127).astype(np.int8).tobytes()
+
+
 # ============================================================================
 # OCR & FILE HANDLING (FIXED)
 # ============================================================================
 
-def get_file_content(file_path: str) -> str:
+def get_ocr_engine():
+    """Process-wide OCR engine; each OCR worker process keeps its own long-lived instance."""
+    global _ocr_engine
+    if _ocr_engine is None:
+        with _ocr_engine_lock:
+            if _ocr_engine is None:
+                _ocr_engine = create_ocr_engine()
+    return _ocr_engine
+
+
+def _init_ocr_worker():
+    """Pool initializer: load the recognizer before the first page arrives."""
+    global _ocr_engine
+    _ocr_engine = None  # Never reuse an engine inherited from the parent via fork
+    get_ocr_engine()
+
+
+def _get_ocr_pool() -> ProcessPoolExecutor:
+    """Lazily create the shared process pool used for per-page OCR."""
+    global _ocr_pool
+    if _ocr_pool is None:
+        with _ocr_pool_lock:
+            if _ocr_pool is None:
+                _ocr_pool = ProcessPoolExecutor(max_workers=OCR_WORKERS, initializer=_init_ocr_worker)
+    return _ocr_pool
+
+
+def _reset_ocr_pool():
+    """Drop a broken OCR pool so the next request starts a fresh one."""
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is not None:
+            _ocr_pool.shutdown(wait=False, cancel_futures=True)
+        _ocr_pool = None
+
+
+def _page_render_plan(page, dpi: int = OCR_DPI) -> tuple:
+    """
+    Pick the DPI for one page and estimate its decoded RGB bitmap size.
+    DPI is lowered (down to OCR_MIN_DPI) so a single page never exceeds the budget.
+    Returns (dpi, estimated_bytes), or (None, estimated_bytes) if the page can't fit.
+    """
+    budget = RENDER_MEMORY_BUDGET_MB * 1024 * 1024
+    try:
+        width_in = abs(float(page.mediabox.width)) / 72
+        height_in = abs(float(page.mediabox.height)) / 72
+    except Exception:
+        width_in, height_in = 8.5, 11  # Assume US Letter if the box is unreadable
+    
+    def estimate(d):
+        return int(width_in * d) * int(height_in * d) * 3
+    
+    if estimate(dpi) > budget:
+        dpi = max(OCR_MIN_DPI, int(dpi * math.sqrt(budget / estimate(dpi))))
+    if estimate(dpi) > budget:
+        return None, estimate(dpi)
+    return dpi, estimate(dpi)
+
+
+@contextmanager
+def _spooled_pdf(data: bytes):
+    """Poppler rasterizes from a file, so spool the buffer once for all renders of a request."""
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp:
+        tmp.write(data)
+    try:
+        yield tmp.name
+    finally:
+        os.unlink(tmp.name)
+
+
+def iter_rendered_pages(file_path: str, pdf, page_numbers=None):
+    """
+    Stream (page_number, PIL image) pairs, rasterizing at most RENDER_WINDOW_PAGES
+    pages per poppler call and never holding more than the memory budget.
+    Each window's images are closed once the consumer moves past them.
+    """
+    if page_numbers is None:
+        page_numbers = range(1, len(pdf.pages) + 1)
+    from pdf2image import convert_from_path
+    budget = RENDER_MEMORY_BUDGET_MB * 1024 * 1024
+    
+    window = []
+    window_bytes = 0
+    
+    def flush():
+        first, dpi = window[0][0], window[0][1]
+        last = window[-1][0]
+        images = convert_from_path(file_path, dpi=dpi, first_page=first, last_page=last)
+        try:
+            for page_number, image in zip(range(first, last + 1), images):
+                yield page_number, image
+        finally:
+            for image in images:
+                image.close()
+    
+    for page_number in page_numbers:
+        dpi, est = _page_render_plan(pdf.pages[page_number - 1])
+        if dpi is None:
+            logger.warning(f"Skipping page {page_number}: exceeds {RENDER_MEMORY_BUDGET_MB}MB render budget")
+            continue
+        contiguous = window and page_number == window[-1][0] + 1 and dpi == window[-1][1]
+        if window and (not contiguous or len(window) >= RENDER_WINDOW_PAGES or window_bytes + est > budget):
+            yield from flush()
+            window, window_bytes = [], 0
+        window.append((page_number, dpi))
+        window_bytes += est
+    if window:
+        yield from flush()
+
+
+def _ocr_page(file_path: str, page_number: int, dpi: int) -> str:
+    """Render a single PDF page and recognize it (runs in an OCR worker process)."""
+    from pdf2image import convert_from_path
+    images = convert_from_path(file_path, dpi=dpi, first_page=page_number, last_page=page_number)
+    try:
+        return get_ocr_engine().recognize(images[0]) if images else ""
+    finally:
+        for image in images:
+            image.close()
+
+
+def _submit_ocr(file_path: str, page_number: int, dpi: int):
+    try:
+        return _get_ocr_pool().submit(_ocr_page, file_path, page_number, dpi)
+    except BrokenProcessPool:
+        _reset_ocr_pool()
+        return _get_ocr_pool().submit(_ocr_page, file_path, page_number, dpi)
+
+
+def iter_ocr_pages(file_path: str, pdf, page_numbers=None):
+    """
+    Yield (page_number, text) for scanned pages in page order.
+    Pages are rendered and recognized in parallel on the OCR pool, but only as many
+    are in flight as fit in RENDER_MEMORY_BUDGET_MB (and at most OCR_WORKERS).
+    Closing the generator early cancels pages that haven't started.
+    """
+    if page_numbers is None:
+        page_numbers = range(1, len(pdf.pages) + 1)
+    budget = RENDER_MEMORY_BUDGET_MB * 1024 * 1024
+    pending = deque(page_numbers)
+    in_flight = deque()  # (page_number, estimated_bytes, future)
+    in_flight_bytes = 0
+    
+    try:
+        while pending or in_flight:
+            while pending and len(in_flight) < OCR_WORKERS:
+                page_number = pending[0]
+                dpi, est = _page_render_plan(pdf.pages[page_number - 1])
+                if dpi is None:
+                    pending.popleft()
+                    logger.warning(f"Skipping page {page_number}: exceeds {RENDER_MEMORY_BUDGET_MB}MB render budget")
+                    continue
+                if in_flight and in_flight_bytes + est > budget:
+                    break
+                pending.popleft()
+                in_flight.append((page_number, est, _submit_ocr(file_path, page_number, dpi)))
+                in_flight_bytes += est
+            
+            if not in_flight:
+                continue
+            page_number, est, future = in_flight.popleft()
+            in_flight_bytes -= est
+            try:
+                text = future.result()
+            except BrokenProcessPool:
+                logger.error("OCR worker pool crashed, resetting")
+                _reset_ocr_pool()
+                text = ""
+            except Exception as e:
+                logger.error(f"OCR failed on page {page_number}: {e}")
+                text = ""
+            yield page_number, text
+    finally:
+        for _, _, future in in_flight:
+            future.cancel()
+
+
+BILL_TOTAL_PATTERN = re.compile(
+    r"\b(grand\s+total|total|net\s+amount|amount\s+payable|amount\s+due|bill\s+amount|balance\s+due)\b[^\d]{0,30}\d",
+    re.IGNORECASE,
+)
+BILL_DIAGNOSIS_PATTERN = re.compile(
+    r"\b(diagnosis|diagnosed\s+with|disease|chief\s+complaint|impression)\b\s*[:\-]?\s*[A-Za-z]",
+    re.IGNORECASE,
+)
+
+
+def bill_fields_found(text: str) -> bool:
+    """True once the text contains both a bill total and a diagnosis (enough for extract_bill_info)."""
+    return bool(BILL_TOTAL_PATTERN.search(text) and BILL_DIAGNOSIS_PATTERN.search(text))
+
+
+def _form_contains_image(form, depth: int = 0) -> bool:
+    """True if a Form XObject paints an image, directly or through nested forms."""
+    try:
+        xobjects = form.get("/Resources", {}).get_object().get("/XObject")
+        if not xobjects or depth > 4:
+            return False
+        for xobj in xobjects.get_object().values():
+            xobj = xobj.get_object()
+            if xobj.get("/Subtype") == "/Image":
+                return True
+            if xobj.get("/Subtype") == "/Form" and _form_contains_image(xobj, depth + 1):
+                return True
+    except Exception:
+        pass
+    return False
+
+
+def _form_area(form) -> float:
+    """Area of a Form XObject's /BBox after its /Matrix, in form space (scaled by the CTM at Do)."""
+    try:
+        x0, y0, x1, y1 = (float(v) for v in form["/BBox"])
+        a, b, c, d = (float(v) for v in form.get("/Matrix", [1, 0, 0, 1, 0, 0])[:4])
+        return abs(x1 - x0) * abs(y1 - y0) * abs(a * d - b * c)
+    except Exception:
+        return 1.0
+
+
+def classify_pdf_page(page) -> tuple:
+    """
+    Classify one PDF page from its text layer and image coverage, in a single content pass.
+    Image coverage is checked first, so a scan with a fax/e-stamp header in its text
+    layer still counts as scanned; images wrapped in Form XObjects count too.
+    Returns (kind, text) where kind is "digital", "scanned" or "blank".
+    """
+    try:
+        width_in = abs(float(page.mediabox.width)) / 72
+        height_in = abs(float(page.mediabox.height)) / 72
+        page_area = max(width_in * height_in * 72 * 72, 1.0)
+    except Exception:
+        page_area = 8.5 * 11 * 72 * 72
+    
+    image_areas = {}  # XObject name -> area in its own space (unit square for images)
+    has_xobjects = False
+    try:
+        xobjects = page["/Resources"].get_object().get("/XObject")
+        if xobjects:
+            for name, xobj in xobjects.get_object().items():
+                has_xobjects = True
+                xobj = xobj.get_object()
+                if xobj.get("/Subtype") == "/Image":
+                    image_areas[name] = 1.0
+                elif xobj.get("/Subtype") == "/Form" and _form_contains_image(xobj):
+                    image_areas[name] = _form_area(xobj)
+    except Exception:
+        pass
+    
+    covered = [0.0]
+    
+    def visit(operator, operands, cm, tm):
+        # XObjects are painted through the CTM, so its determinant scales their area
+        if operator == b"Do" and operands and operands[0] in image_areas:
+            covered[0] += abs(cm[0] * cm[3] - cm[1] * cm[2]) * image_areas[operands[0]]
+    
+    try:
+        text = page.extract_text(visitor_operand_before=visit if image_areas else None) or ""
+    except Exception:
+        text = ""
+    
+    density = len(text.strip()) / (page_area / (72 * 72))
+    coverage = min(1.0, covered[0] / page_area)
+    
+    if coverage >= PAGE_IMAGE_COVERAGE_MIN:
+        return "scanned", text  # The text layer is kept; OCR only runs if it lacks the bill fields
+    if density >= PAGE_TEXT_DENSITY_MIN:
+        return "digital", text
+    if text.strip():
+        return "digital", text  # Sparse text, no scan (e.g. a cover page) - nothing to OCR
+    if has_xobjects:
+        return "scanned", ""  # Painted content we couldn't measure and no text: OCR it to be safe
+    return "blank", ""
+
+
+def get_file_content(upload: dict) -> str:
     """
     FIXED: Extract text from PDF or Image.
-    Uses Vision AI (llama3.2-vision) for images, falls back to PyPDF/OCR for PDFs.
+    Uses Vision AI (VISION_MODEL) for images, falls back to PyPDF/OCR for PDFs.
+    Works on the upload parsed once by validate_uploaded_file(); nothing is re-read from disk.
+    PDF pages are classified individually: digital pages use their text layer, blank
+    pages are skipped, and only scanned pages are rasterized. OCR stops as soon as
+    the bill total and diagnosis have been found.
     """
-    text = ""
+    mime = upload["mime"]
     
     try:
-        mime = magic.from_file(file_path, mime=True)
-        
         # If it's an image, directly use Vision model
         if mime in ['image/jpeg', 'image/png']:
             logger.info("Image detected, attempting Vision AI extraction...")
-            vision_text = extract_text_with_vision(file_path)
+            vision_text = extract_text_with_vision(upload["data"])
             if vision_text:
                 return vision_text.strip()
-                
-        # If it's a PDF, try digital text first
-        if mime == 'application/pdf':
-            with open(file_path, "rb") as f:
-                pdf = PdfReader(f)
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-                        
-            # If no digital text, try OCR (Tesseract) or convert to image for Vision
-            if not text.strip() and OCR_AVAILABLE:
-                logger.info("No digital text found, attempting OCR...")
+            return ""
+        
+        if mime != 'application/pdf':
+            return ""
+        
+        # Per-page classification on the same PdfReader used for validation
+        pdf = upload["pdf"]
+        page_texts = {}
+        scanned_pages = []
+        kinds = {"digital": 0, "scanned": 0, "blank": 0}
+        for page_number, page in enumerate(pdf.pages, start=1):
+            kind, page_text = classify_pdf_page(page)
+            kinds[kind] += 1
+            if kind == "digital":
+                page_texts[page_number] = page_text
+            elif kind == "scanned":
+                scanned_pages.append(page_number)
+                if page_text.strip():
+                    page_texts[page_number] = page_text
+        logger.info(
+            f"PDF pages: {kinds['digital']} digital, {kinds['scanned']} scanned, {kinds['blank']} blank"
+        )
+        
+        def combined():
+            return "\n".join(page_texts[n] for n in sorted(page_texts))
+        
+        if scanned_pages and not bill_fields_found(combined()):
+            if not OCR_AVAILABLE:
+                logger.warning(f"{len(scanned_pages)} scanned pages skipped: OCR not available")
+            else:
                 try:
-                    images = convert_from_path(file_path)
-                    
-                    # Try to use vision model on the first page as a fallback check
-                    if images:
-                        with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as tmp:
-                            images[0].save(tmp.name, 'JPEG')
-                            vision_fallback = extract_text_with_vision(tmp.name)
-                            if vision_fallback:
-                                text += vision_fallback + "\n"
-                                logger.info("Vision AI fallback successful on PDF")
-                            os.unlink(tmp.name)
-                            
-                    # Tesseract loop for all pages
-                    if not text.strip():
-                        for i, image in enumerate(images):
-                            page_text = pytesseract.image_to_string(image)
-                            text += page_text + "\n"
+                    with _spooled_pdf(upload["data"]) as pdf_path:
+                        # Fully scanned document: transcribe pages with the vision model concurrently
+                        if not combined().strip():
+                            vision_texts = extract_pages_with_vision(pdf_path, pdf, scanned_pages)
+                            for page_number, vision_text in vision_texts.items():
+                                if vision_text.strip():
+                                    page_texts[page_number] = vision_text
+                            scanned_pages = [n for n in scanned_pages if n not in page_texts]
+                            if vision_texts:
+                                logger.info(f"Vision AI fallback transcribed {len(vision_texts)} PDF pages")
+                        
+                        # Streamed, parallel Tesseract pass over the remaining scanned pages
+                        if scanned_pages and not bill_fields_found(combined()):
+                            started = time.perf_counter()
+                            pages_done = 0
+                            ocr_pages = iter_ocr_pages(pdf_path, pdf, scanned_pages)
+                            try:
+                                for page_number, page_text in ocr_pages:
+                                    page_texts[page_number] = page_text
+                                    pages_done += 1
+                                    if bill_fields_found(combined()):
+                                        break
+                            finally:
+                                ocr_pages.close()
+                            logger.info(
+                                f"OCR'd {pages_done}/{len(scanned_pages)} scanned pages with "
+                                f"{OCR_WORKERS} {select_ocr_backend()} workers in {time.perf_counter() - started:.1f}s"
+                            )
                 except Exception as ocr_err:
                     logger.error(f"OCR/Vision fallback failed: {ocr_err}")
         
-        elif not text.strip() and not OCR_AVAILABLE:
-            logger.warning("No digital text found and OCR not available")
+        return combined().strip()
         
     except Exception as e:
         logger.error(f"PDF read error: {e}")
-    finally:
-        # Clean up temp file
-        if temp_path and os.path.exists(temp_path):
-            os.unlink(temp_path)
+        return ""
+
+
+def prepare_image_for_vision(image) -> bytes:
+    """
+    Compact an image (PIL image or raw bytes) for the vision model, entirely in memory:
+    apply EXIF orientation, crop uniform margins, downscale to VISION_MAX_SIDE and
+    re-encode as JPEG. Raw bytes are passed through unchanged if Pillow is missing.
+    """
+    if not PIL_AVAILABLE:
+        return image if isinstance(image, bytes) else b""
+    from PIL import Image, ImageChops, ImageOps
     
-    return text.strip()
+    if isinstance(image, bytes):
+        image = Image.open(io.BytesIO(image))
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    
+    # Crop margins: anything close to the corner colour counts as background
+    background = Image.new("RGB", image.size, image.getpixel((0, 0)))
+    diff = ImageChops.difference(image, background).convert("L").point(lambda p: 255 if p > 24 else 0)
+    bbox = diff.getbbox()
+    if bbox:
+        pad = max(8, min(image.size) // 100)
+        bbox = (
+            max(0, bbox[0] - pad), max(0, bbox[1] - pad),
+            min(image.width, bbox[2] + pad), min(image.height, bbox[3] + pad),
+        )
+        image = image.crop(bbox)
+    
+    image.thumbnail((VISION_MAX_SIDE, VISION_MAX_SIDE), Image.LANCZOS)
+    
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=VISION_JPEG_QUALITY, optimize=True)
+    return buffer.getvalue()
 
 
-def extract_text_with_vision(image_path: str) -> str:
-    """Use llama3.2-vision to extract and analyze text from an image."""
+def extract_text_with_vision(image, preprocess: bool = True) -> str:
+    """Use the vision model to extract and analyze text from an in-memory image (bytes or PIL)."""
     try:
-        with open(image_path, "rb") as image_file:
-            encoded_string = base64.b64encode(image_file.read()).decode("utf-8")
+        original_kb = len(image) // 1024 if isinstance(image, bytes) and preprocess else None
+        try:
+            image_bytes = prepare_image_for_vision(image) if preprocess else image
+        except Exception as e:
+            if not isinstance(image, bytes):
+                raise
+            logger.warning(f"Vision preprocessing failed, sending original image: {e}")
+            image_bytes = image
+        encoded_string = base64.b64encode(image_bytes).decode("utf-8")
         
-        logger.info(f"Analyzing {image_path} with llama3.2-vision...")
-        response = chat(
-            model="llama3.2-vision",
+        size_note = f"{original_kb}KB -> " if original_kb is not None else ""
+        logger.info(f"Analyzing {size_note}{len(image_bytes) // 1024}KB image with {VISION_MODEL}...")
+        response = ollama_chat(
+            operation="vision",
+            model=VISION_MODEL,
             messages=[
                 {
                     "role": "user",
@@ -217,73 +771,117 @@ def extract_text_with_vision(image_path: str) -> str:
         )
         return response.get("message", {}).get("content", "")
     except Exception as e:
-        logger.error(f"Vision model extraction failed. Make sure 'llama3.2-vision' is pulled. Error: {e}")
+        logger.error(f"Vision model extraction failed. Make sure '{VISION_MODEL}' is pulled. Error: {e}")
         return ""
 
 
+def extract_pages_with_vision(pdf_path: str, pdf, page_numbers) -> dict:
+    """
+    Transcribe scanned PDF pages with the vision model concurrently (bounded by the
+    per-model semaphore), up to VISION_PAGE_BUDGET pages. Pages are rendered lazily,
+    so once the bill total and diagnosis are found nothing else is rendered or sent.
+    Returns {page_number: text}; callers merge in page order.
+    """
+    page_numbers = list(page_numbers)[:VISION_PAGE_BUDGET]
+    results = {}
+    pending = {}  # future -> page_number
+    
+    def collect(block: bool) -> bool:
+        done, _ = wait(list(pending), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in done:
+            results[pending.pop(future)] = future.result() or ""
+        merged = "\n".join(results[n] for n in sorted(results))
+        return bill_fields_found(merged)
+    
+    pages = iter_rendered_pages(pdf_path, pdf, page_numbers)
+    try:
+        for page_number, image in pages:
+            while len(pending) >= VISION_MAX_CONCURRENCY:
+                if collect(block=True):
+                    return results
+            if pending and collect(block=False):
+                return results
+            # Compact before the rendered bitmap is released by the streaming renderer
+            image_bytes = prepare_image_for_vision(image)
+            pending[_vision_executor.submit(extract_text_with_vision, image_bytes, False)] = page_number
+        while pending:
+            if collect(block=True):
+                break
+    finally:
+        pages.close()
+        for future in pending:
+            future.cancel()
+    return results
+
+
 def validate_uploaded_file(file) -> tuple:
     """
     NEW: Comprehensive file validation with magic bytes.
-    Returns: (is_valid, error_message, safe_filename)
+    The upload is read into memory exactly once; the parsed result is returned
+    so type detection and text extraction reuse it.
+    Returns: (is_valid, error_message, safe_filename, upload)
     """
     if not file or not file.filename:
-        return False, "No file provided", None
+        return False, "No file provided", None, None
     
     # Check 1: Extension
     ext = file.filename.lower().split('.')[-1]
     if ext not in ['pdf', 'jpg', 'jpeg', 'png']:
-        return False, "Only PDF or Image (JPG/PNG) files are accepted", None
+        return False, "Only PDF or Image (JPG/PNG) files are accepted", None, None
     
-    # Check 2: File size
+    # Check 2: File size (seek, so oversize uploads are rejected without being read)
     file.seek(0, 2)
     size = file.tell()
     file.seek(0)
     
     if size > MAX_FILE_SIZE:
-        return False, f"File too large ({size/1024/1024:.1f}MB > {MAX_FILE_SIZE//(1024*1024)}MB)", None
+        return False, f"File too large ({size/1024/1024:.1f}MB > {MAX_FILE_SIZE//(1024*1024)}MB)", None, None
+    
+    data = file.read(MAX_FILE_SIZE + 1)
+    if len(data) > MAX_FILE_SIZE:
+        return False, f"File too large (> {MAX_FILE_SIZE//(1024*1024)}MB)", None, None
     
-    if size == 0:
-        return False, "Empty file", None
+    if not data:
+        return False, "Empty file", None, None
     
     # Check 3: Magic bytes (actual file type)
     try:
-        file_header = file.read(1024)
-        file.seek(0)
-        
-        mime = magic.from_buffer(file_header, mime=True)
+        mime = magic.from_buffer(data[:2048], mime=True)
         if mime not in ['application/pdf', 'image/jpeg', 'image/png']:
-            return False, f"File is not a valid PDF or Image (detected: {mime})", None
+            return False, f"File is not a valid PDF or Image (detected: {mime})", None, None
         
         # Check 4: PDF structure only if it is a pdf
+        pdf = None
         if mime == 'application/pdf':
-            pdf = PdfReader(file)
-            file.seek(0)
+            from PyPDF2 import PdfReader
+            pdf = PdfReader(io.BytesIO(data))
             
             if len(pdf.pages) == 0:
-                return False, "PDF has no pages", None
+                return False, "PDF has no pages", None, None
             
             if len(pdf.pages) > 50:
-                return False, "PDF too large (max 50 pages)", None
+                return False, "PDF too large (max 50 pages)", None, None
             
     except Exception as e:
-        return False, f"Corrupted PDF: {str(e)}", None
+        return False, f"Corrupted PDF: {str(e)}", None, None
     
     # Check 5: Sanitize filename
     safe_name = "".join(c for c in file.filename if c.isalnum() or c in "._-")
     if not safe_name:
         safe_name = f"claim_{uuid.uuid4().hex[:8]}.pdf"
     
-    return True, None, safe_name
+    upload = {
+        "data": data,
+        "mime": mime,
+        "pdf": pdf,
+        "content_hash": hashlib.sha256(data).hexdigest(),
+    }
+    return True, None, safe_name, upload
 
 
-def save_uploaded_file(file, claim_id: str, safe_name: str = None) -> str:
-    """Save original PDF for audit trail."""
+def _write_upload(file_path: Path, data: bytes) -> Optional[str]:
     try:
-        if safe_name is None:
-            safe_name = "".join(c for c in file.filename if c.isalnum() or c in "._-")
-        file_path = UPLOAD_DIR / f"{claim_id}_{safe_name}"
-        file.seek(0)
-        file.save(file_path)
+        file_path.write_bytes(data)
         logger.info(f"Saved uploaded file: {file_path}")
         return str(file_path)
     except Exception as e:
@@ -291,14 +889,312 @@ def save_uploaded_file(file, claim_id: str, safe_name: str = None) -> str:
         return None
 
 
+def save_uploaded_file(data: bytes, claim_id: str, safe_name: str) -> Future:
+    """
+    Save original upload for audit trail.
+    The write happens off the request path; the returned future resolves to the
+    saved path, or None if the write failed, and is awaited before the claim row
+    records it.
+    """
+    file_path = UPLOAD_DIR / f"{claim_id}_{safe_name}"
+    return _upload_executor.submit(_write_upload, file_path, data)
+
+
 # ============================================================================
 # OLLAMA & EMBEDDINGS
 # ============================================================================
 
+@contextmanager
+def model_slot(model: str):
+    """Hold one of the model's MODEL_CONCURRENCY slots for the duration of a request."""
+    limit = MODEL_CONCURRENCY.get(model)
+    if not limit:
+        yield
+        return
+    with _model_semaphores_lock:
+        semaphore = _model_semaphores.setdefault(model, threading.BoundedSemaphore(limit))
+    with semaphore:
+        yield
+
+
+def get_ollama_client(operation: str) -> OllamaClient:
+    """
+    One pooled client per operation type, so each gets its own timeout while
+    reusing keep-alive connections across requests and threads.
+    """
+    client = _ollama_clients.get(operation)
+    if client is None:
+        with _ollama_clients_lock:
+            client = _ollama_clients.get(operation)
+            if client is None:
+                client = OllamaClient(
+                    host=OLLAMA_BASE_URL,
+                    timeout=httpx.Timeout(OLLAMA_TIMEOUTS[operation], connect=OLLAMA_CONNECT_TIMEOUT),
+                    limits=httpx.Limits(
+                        max_connections=OLLAMA_POOL_SIZE,
+                        max_keepalive_connections=OLLAMA_POOL_SIZE,
+                    ),
+                )
+                _ollama_clients[operation] = client
+    return client
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, ResponseError):
+        return error.status_code >= 500 or error.status_code == 429
+    return isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError))
+
+
+def _with_retries(operation: str, model: str, call):
+    """Run call() under the model's concurrency cap, retrying transient failures with jittered backoff."""
+    for attempt in range(OLLAMA_MAX_RETRIES + 1):
+        try:
+            with model_slot(model):
+                return call()
+        except Exception as e:
+            if attempt >= OLLAMA_MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay = OLLAMA_RETRY_BASE_DELAY * (2 ** attempt) * random.uniform(0.5, 1.5)
+            logger.warning(f"Ollama {operation} ({model}) failed: {e}; retry {attempt + 1} in {delay:.2f}s")
+            time.sleep(delay)
+
+
+def _stream_with_retries(operation: str, model: str, kwargs: dict):
+    """
+    Streaming variant: the model slot is held until the stream is exhausted or closed.
+    Only failures before the first chunk are retried (nothing has reached the caller yet).
+    """
+    for attempt in range(OLLAMA_MAX_RETRIES + 1):
+        with model_slot(model):
+            received = False
+            try:
+                for chunk in get_ollama_client(operation).chat(stream=True, **kwargs):
+                    received = True
+                    yield chunk
+                return
+            except Exception as e:
+                if received or attempt >= OLLAMA_MAX_RETRIES or not _is_retryable(e):
+                    raise
+                delay = OLLAMA_RETRY_BASE_DELAY * (2 ** attempt) * random.uniform(0.5, 1.5)
+                logger.warning(f"Ollama {operation} stream ({model}) failed: {e}; retry {attempt + 1} in {delay:.2f}s")
+        time.sleep(delay)
+
+
+def ollama_chat(operation: str = "chat", stream: bool = False, **kwargs):
+    """Chat through the shared client layer (timeouts, retries, per-model caps)."""
+    model = kwargs["model"]
+    if stream:
+        return _stream_with_retries(operation, model, kwargs)
+    return _with_retries(operation, model, lambda: get_ollama_client(operation).chat(**kwargs))
+
+
+def ollama_embed(model: str, input):
+    """Embed through the shared client layer (timeouts, retries, per-model caps)."""
+    return _with_retries("embed", model, lambda: get_ollama_client("embed").embed(model=model, input=input))
+
+
+class EmbeddingBatcher:
+    """
+    Micro-batches single-text embedding requests from all threads.
+    Requests arriving within EMBED_BATCH_WINDOW_MS (up to EMBED_MAX_BATCH) are sent as
+    one embed(input=[...]) call; each caller gets its vector through a Future.
+    """
+    
+    def __init__(self, model: str, window_ms: float = EMBED_BATCH_WINDOW_MS,
+                 max_batch: int = EMBED_MAX_BATCH, max_inflight: int = EMBED_MAX_INFLIGHT_BATCHES):
+        self.model = model
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.stats = {"requests": 0, "batches": 0, "texts_sent": 0}
+        self._queue = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix=f"embed-{model}")
+        self._inflight = threading.BoundedSemaphore(max_inflight)
+        self._stats_lock = threading.Lock()
+        threading.Thread(target=self._collect, name=f"embed-batcher-{model}", daemon=True).start()
+    
+    def submit(self, text: str) -> Future:
+        future = Future()
+        self._queue.put((text, future))
+        return future
+    
+    def embed(self, text: str, timeout: float = EMBED_RESULT_TIMEOUT) -> list:
+        future = self.submit(text)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()  # Dropped from its batch if that hasn't been dispatched yet
+            raise
+    
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # Backpressure: while batches are in flight, new requests keep accumulating
+            self._inflight.acquire()
+            self._executor.submit(self._dispatch, batch)
+    
+    def _dispatch(self, batch: list):
+        try:
+            # Callers that timed out have cancelled their futures; the rest can no longer be cancelled
+            batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+            unique = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                if unique:
+                    embeddings = ollama_embed(self.model, unique)["embeddings"]
+                    if len(embeddings) != len(unique):
+                        raise ValueError(f"Expected {len(unique)} embeddings from {self.model}, got {len(embeddings)}")
+                    by_text = dict(zip(unique, embeddings))
+                    for text, future in batch:
+                        future.set_result(by_text[text])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            with self._stats_lock:
+                self.stats["requests"] += len(batch)
+                self.stats["batches"] += 1
+                self.stats["texts_sent"] += len(unique)
+        finally:
+            self._inflight.release()
+
+
+def get_embedding_batcher(model: str = EMBEDDING_MODEL) -> EmbeddingBatcher:
+    batcher = _embedding_batchers.get(model)
+    if batcher is None:
+        with _embedding_batchers_lock:
+            batcher = _embedding_batchers.get(model)
+            if batcher is None:
+                batcher = _embedding_batchers[model] = EmbeddingBatcher(model)
+    return batcher
+
+
+def embed_text(text: str, model: str = EMBEDDING_MODEL) -> list:
+    """Embed one string via the shared micro-batcher, at the model's native size."""
+    return get_embedding_batcher(model).embed(text)
+
+
+def get_embedding_batcher_stats() -> dict:
+    stats = {}
+    for model, batcher in list(_embedding_batchers.items()):
+        with batcher._stats_lock:
+            model_stats = dict(batcher.stats)
+        if model_stats["batches"]:
+            model_stats["avg_batch_size"] = round(model_stats["requests"] / model_stats["batches"], 2)
+        stats[model] = model_stats
+    return stats
+
+
+def _normalize_embedding_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def get_embedding(text: str, model: str = EMBEDDING_MODEL) -> list:
+    """
+    Embed one string through the two-tier cache: in-process LRU, then the SQLite
+    embedding_cache table (packed float32), then the micro-batcher on a miss.
+    The table keeps native-size vectors so any EMBEDDING_DIM can be served from it;
+    the returned vector is truncated to EXPECTED_EMBEDDING_DIM.
+    Callers keep their own case handling (diagnoses are lower-cased before this).
+    """
+    text = _normalize_embedding_text(text)
+    key = (model, text)
+    
+    with _embedding_lru_lock:
+        vector = _embedding_lru.get(key)
+        if vector is not None:
+            _embedding_lru.move_to_end(key)
+            _embedding_cache_stats["memory_hits"] += 1
+            return vector
+    
+    vector = None
+    try:
+        with get_db() as conn:
+            row = conn.execute(
+                "SELECT vector FROM embedding_cache WHERE model = ? AND text = ?", (model, text)
+            ).fetchone()
+            # Longer cached vectors (e.g. native 768-d) truncate exactly; shorter ones are a miss
+            if row and len(row["vector"]) // 4 >= EXPECTED_EMBEDDING_DIM:
+                blob = row["vector"]
+                vector = fit_embedding_dim(struct.unpack(f"{len(blob) // 4}f", blob))
+    except Exception as e:
+        logger.debug(f"Embedding cache read skipped: {e}")
+    
+    if vector is not None:
+        stat = "db_hits"
+    else:
+        stat = "misses"
+        native = embed_text(text, model)
+        vector = fit_embedding_dim(native)
+        try:
+            with get_db() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO embedding_cache (model, text, vector) VALUES (?, ?, ?)",
+                    (model, text, struct.pack(f"{len(native)}f", *native)),
+                )
+                conn.execute(
+                    """DELETE FROM embedding_cache WHERE rowid IN (
+                        SELECT rowid FROM embedding_cache
+                        ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                    )""",
+                    (EMBEDDING_CACHE_MAX_ENTRIES,),
+                )
+                conn.commit()
+        except Exception as e:
+            logger.debug(f"Embedding cache write skipped: {e}")
+    
+    with _embedding_lru_lock:
+        _embedding_cache_stats[stat] += 1
+        _embedding_lru[key] = vector
+        _embedding_lru.move_to_end(key)
+        while len(_embedding_lru) > EMBEDDING_LRU_SIZE:
+            _embedding_lru.popitem(last=False)
+    return vector
+
+
+def get_embedding_cache_stats() -> dict:
+    with _embedding_lru_lock:
+        stats = dict(_embedding_cache_stats)
+        stats["memory_entries"] = len(_embedding_lru)
+    lookups = stats["memory_hits"] + stats["db_hits"] + stats["misses"]
+    stats["hit_ratio"] = round((lookups - stats["misses"]) / lookups, 3) if lookups else None
+    return stats
+
+
+class OllamaGatewayEmbeddings:
+    """Query embeddings adapter (LangChain's embed_query) on the cached, pooled client."""
+    
+    def __init__(self, model: str = EMBEDDING_MODEL):
+        self.model = model
+    
+    def embed_query(self, text):
+        return get_embedding(text, self.model)
+
+
+def _get_health_session():
+    global _health_session
+    if _health_session is None:
+        session = http_requests.Session()
+        session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        _health_session = session
+    return _health_session
+
+
 def check_ollama_status():
     """Check if Ollama is running and required models are available."""
     try:
-        resp = http_requests.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=5)
+        resp = _get_health_session().get(
+            f"{OLLAMA_BASE_URL}/api/tags",
+            timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_TIMEOUTS["health"]),
+        )
         if resp.status_code == 200:
             model_names = [m["name"] for m in resp.json().get("models", [])]
             for required in [MAIN_MODEL, EMBEDDING_MODEL]:
@@ -306,98 +1202,685 @@ def check_ollama_status():
                     return False, f"Missing model: {required}"
             return True, "Ollama is running and all models are available"
         return False, "Ollama is not responding"
-    except http_requests.exceptions.ConnectionError:
+    except (http_requests.exceptions.ConnectionError, http_requests.exceptions.Timeout):
         return False, "Cannot connect to Ollama. Is it running?"
     except Exception as e:
         return False, f"Error: {e}"
 
 
-def get_faiss_db():
-    """Load or create FAISS vector store (cached in memory with thread safety)."""
-    global cached_faiss_db
+# ============================================================================
+# POLICY INDEX (manifest-driven incremental builds, memory-mapped serving)
+# ============================================================================
+
+def _policy_manifest_path(folder: str) -> str:
+    return os.path.join(folder, "manifest.json")
+
+
+def _policy_version_dir(version: int) -> str:
+    return os.path.join(POLICY_INDEX_DIR, f"v{version}")
+
+
+def _policy_versions_on_disk() -> list:
+    if not os.path.isdir(POLICY_INDEX_DIR):
+        return []
+    return sorted(int(name[1:]) for name in os.listdir(POLICY_INDEX_DIR) if re.fullmatch(r"v\d+", name))
+
+
+def current_policy_index_dir() -> Optional[str]:
+    """Version directory named by the CURRENT pointer, or None before the first build."""
+    try:
+        with open(os.path.join(POLICY_INDEX_DIR, POLICY_INDEX_POINTER), encoding="utf-8") as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+    folder = os.path.join(POLICY_INDEX_DIR, name)
+    return folder if name and os.path.isdir(folder) else None
+
+
+def load_policy_manifest(folder: Optional[str] = None) -> dict:
+    """
+    Manifest written next to the index files (default: the current published version):
+    {"format", "version", "dim", "files": {relpath: {sha256, size, mtime}}, "documents": {sha256: {source, chunk_ids}}}
+    Chunks are keyed by content hash, so byte-identical PDFs are embedded once.
+    """
+    folder = folder or current_policy_index_dir()
+    if folder is None:
+        return {}
+    try:
+        with open(_policy_manifest_path(folder), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _file_sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_policy_documents(previous_files: dict) -> dict:
+    """Current PDFs under DOCUMENTS_DIR; only files whose size/mtime changed are re-hashed."""
+    root = Path(DOCUMENTS_DIR)
+    if not root.exists():
+        root.mkdir(parents=True)
+        return {}
     
-    if cached_faiss_db is not None:
-        return cached_faiss_db
+    files = {}
+    for path in sorted(root.rglob("*.pdf")):
+        rel = path.relative_to(root).as_posix()
+        st = path.stat()
+        previous = previous_files.get(rel)
+        if previous and previous["size"] == st.st_size and previous["mtime"] == st.st_mtime:
+            files[rel] = previous
+        else:
+            files[rel] = {"sha256": _file_sha256(path), "size": st.st_size, "mtime": st.st_mtime}
+    return files
+
+
+def load_policy_chunks(path: str) -> list:
+    """Load one PDF and split it into retrieval chunks."""
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    docs = PyPDFLoader(path).load()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=POLICY_CHUNK_SIZE, chunk_overlap=POLICY_CHUNK_OVERLAP)
+    return splitter.split_documents(docs)
+
+
+def parse_policy_pdf(path: str, sha: str) -> tuple:
+    """Process-pool task: one PDF -> (texts, metadatas, chunk ids). Plain lists pickle cheaply."""
+    chunks = load_policy_chunks(path)
+    return (
+        [chunk.page_content for chunk in chunks],
+        [chunk.metadata for chunk in chunks],
+        [f"{sha[:16]}-{i}" for i in range(len(chunks))],
+    )
+
+
+def _embed_policy_batch(texts: list) -> list:
+    embeddings = ollama_embed(EMBEDDING_MODEL, texts)["embeddings"]
+    if len(embeddings) != len(texts):
+        raise ValueError(f"Expected {len(texts)} embeddings from {EMBEDDING_MODEL}, got {len(embeddings)}")
+    return [fit_embedding_dim(v) for v in embeddings]
+
+
+def ingest_policy_documents(db, pending: list) -> dict:
+    """
+    Add new PDFs to `db`. PDFs are parsed on a process pool; as each one finishes its
+    chunks are cut into POLICY_EMBED_BATCH-sized embed requests, with at most
+    POLICY_EMBED_INFLIGHT in flight, and every batch is added to the index as it lands.
+    `pending` is [(sha256, relpath)]; returns the manifest "documents" entries.
+    PDFs that fail to parse are logged and left out, so the next sync retries them.
+    """
+    documents = {}
+    if not pending:
+        return documents
+    
+    started = time.perf_counter()
+    progress = {"parsed": 0, "chunks": 0, "embedded": 0}
+    inflight = {}  # embed future -> (texts, metadatas, ids)
+    
+    def drain(limit: int):
+        while len(inflight) > limit:
+            done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            for future in done:
+                texts, metadatas, ids = inflight.pop(future)
+                db.add_embeddings(list(zip(texts, future.result())), metadatas=metadatas, ids=ids)
+                progress["embedded"] += len(ids)
+                rate = progress["embedded"] / max(time.perf_counter() - started, 1e-6)
+                logger.info(
+                    f"Policy index: {progress['embedded']}/{progress['chunks']} chunks embedded, "
+                    f"{progress['parsed']}/{len(pending)} PDFs parsed ({rate:.1f} chunks/s)"
+                )
+    
+    workers = min(POLICY_PARSE_WORKERS, len(pending))
+    with ProcessPoolExecutor(max_workers=workers) as parse_pool, \
+            ThreadPoolExecutor(max_workers=POLICY_EMBED_INFLIGHT, thread_name_prefix="policy-embed") as embed_pool:
+        parsing = {
+            parse_pool.submit(parse_policy_pdf, os.path.join(DOCUMENTS_DIR, rel), sha): (sha, rel)
+            for sha, rel in pending
+        }
+        for parsed in as_completed(parsing):
+            sha, rel = parsing[parsed]
+            try:
+                texts, metadatas, ids = parsed.result()
+            except Exception as e:
+                logger.error(f"Policy index: skipping {rel}, could not parse it: {e}")
+                continue
+            documents[sha] = {"source": rel, "chunk_ids": ids}
+            progress["parsed"] += 1
+            progress["chunks"] += len(ids)
+            for i in range(0, len(ids), POLICY_EMBED_BATCH):
+                drain(POLICY_EMBED_INFLIGHT - 1)
+                batch_texts = texts[i:i + POLICY_EMBED_BATCH]
+                future = embed_pool.submit(_embed_policy_batch, batch_texts)
+                inflight[future] = (batch_texts, metadatas[i:i + POLICY_EMBED_BATCH], ids[i:i + POLICY_EMBED_BATCH])
+        drain(0)
+    
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"Policy index: ingested {len(documents)}/{len(pending)} PDFs, {progress['embedded']} chunks in {elapsed:.1f}s "
+        f"({progress['embedded'] / max(elapsed, 1e-6):.1f} chunks/s)"
+    )
+    return documents
+
+
+class PolicyIndexBuilder:
+    """Mutable side of the policy index, used only while syncing; written out as the mapped format."""
+    
+    def __init__(self, dim: int = EXPECTED_EMBEDDING_DIM):
+        self.dim = dim
+        self.chunk_ids, self.texts, self.metadatas = [], [], []
+        self._blocks = [np.zeros((0, dim), dtype=np.float32)]
+    
+    @classmethod
+    def load(cls, folder: str) -> "PolicyIndexBuilder":
+        """Private, fully in-memory copy of an on-disk index for incremental updates."""
+        vectors = np.load(os.path.join(folder, POLICY_VECTORS_FILE))
+        builder = cls(vectors.shape[1])
+        builder._blocks = [vectors]
+        conn = sqlite3.connect(os.path.join(folder, POLICY_CHUNKS_FILE))
+        try:
+            for chunk_id, content, metadata in conn.execute("SELECT chunk_id, content, metadata FROM chunks ORDER BY row"):
+                builder.chunk_ids.append(chunk_id)
+                builder.texts.append(content)
+                builder.metadatas.append(json.loads(metadata))
+        finally:
+            conn.close()
+        return builder
+    
+    @property
+    def ntotal(self) -> int:
+        return len(self.chunk_ids)
+    
+    def _vectors(self) -> np.ndarray:
+        if len(self._blocks) > 1:
+            self._blocks = [np.vstack(self._blocks)]
+        return self._blocks[0]
+    
+    def add_embeddings(self, text_embeddings: list, metadatas: list, ids: list):
+        self.texts.extend(text for text, _ in text_embeddings)
+        self._blocks.append(np.asarray([vector for _, vector in text_embeddings], dtype=np.float32))
+        self.metadatas.extend(metadatas)
+        self.chunk_ids.extend(ids)
+    
+    def delete(self, ids: list):
+        drop = set(ids)
+        keep = [i for i, chunk_id in enumerate(self.chunk_ids) if chunk_id not in drop]
+        self._blocks = [self._vectors()[keep]]
+        self.chunk_ids = [self.chunk_ids[i] for i in keep]
+        self.texts = [self.texts[i] for i in keep]
+        self.metadatas = [self.metadatas[i] for i in keep]
+    
+    def write(self, folder: str):
+        """vectors.npy (row-aligned float32) + norms.npy + chunks.sqlite (row -> text/metadata)."""
+        os.makedirs(folder, exist_ok=True)
+        vectors = np.ascontiguousarray(self._vectors(), dtype=np.float32)
+        np.save(os.path.join(folder, POLICY_VECTORS_FILE), vectors)
+        np.save(os.path.join(folder, POLICY_NORMS_FILE), np.einsum("ij,ij->i", vectors, vectors))
+        conn = sqlite3.connect(os.path.join(folder, POLICY_CHUNKS_FILE))
+        try:
+            conn.execute(
+                "CREATE TABLE chunks (row INTEGER PRIMARY KEY, chunk_id TEXT NOT NULL UNIQUE, "
+                "content TEXT NOT NULL, metadata TEXT NOT NULL)"
+            )
+            conn.executemany(
+                "INSERT INTO chunks (row, chunk_id, content, metadata) VALUES (?, ?, ?, ?)",
+                [(row, chunk_id, text, json.dumps(meta))
+                 for row, (chunk_id, text, meta) in enumerate(zip(self.chunk_ids, self.texts, self.metadatas))],
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+
+class MappedPolicyIndex:
+    """
+    Read-only policy index served from one published version directory. vectors.npy is
+    memory-mapped, so every worker process shares the same page-cache pages and opening is
+    near-instant; chunk text is looked up by row in chunks.sqlite. Exact L2 search, like IndexFlatL2.
+    Version directories are immutable once published; close() releases the files.
+    """
     
-    with _cache_lock:
-        if cached_faiss_db is not None:
-            return cached_faiss_db
+    def __init__(self, folder: str, embeddings: OllamaGatewayEmbeddings):
+        self.embeddings = embeddings
+        self.vectors = np.load(os.path.join(folder, POLICY_VECTORS_FILE), mmap_mode="r")
+        self.norms = np.load(os.path.join(folder, POLICY_NORMS_FILE))
+        self.ntotal, self.dim = self.vectors.shape
+        # Opened now, not lazily: the version may be pruned from disk after a later sync
+        self._docstore = sqlite3.connect(
+            f"file:{os.path.abspath(os.path.join(folder, POLICY_CHUNKS_FILE))}?mode=ro",
+            uri=True, check_same_thread=False,
+        )
+        self._docstore_lock = threading.Lock()
+    
+    def similarity_search_by_vector(self, embedding, k: int = 4) -> list:
+        from langchain_core.documents import Document
+        vectors, norms = self.vectors, self.norms  # Stay valid for this search even if close() runs
+        if self._docstore is None:
+            raise RuntimeError("Policy index is closed")
+        if not len(vectors):
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        distances = norms - 2 * (vectors @ query)  # ||v - q||^2 minus the constant ||q||^2
+        k = min(k, len(vectors))
+        top = np.argpartition(distances, k - 1)[:k]
+        rows = [int(i) for i in top[np.argsort(distances[top])]]
         
+        placeholders = ",".join("?" * len(rows))
+        with self._docstore_lock:
+            if self._docstore is None:
+                raise RuntimeError("Policy index is closed")
+            found = {
+                row: (content, metadata) for row, content, metadata in self._docstore.execute(
+                    f"SELECT row, content, metadata FROM chunks WHERE row IN ({placeholders})", rows
+                )
+            }
+        return [
+            Document(page_content=found[row][0], metadata=json.loads(found[row][1]))
+            for row in rows if row in found
+        ]
+    
+    def similarity_search(self, query: str, k: int = 4) -> list:
+        return self.similarity_search_by_vector(self.embeddings.embed_query(query), k=k)
+    
+    def close(self):
+        """
+        Close the docstore and drop the mapping (unmapped once in-flight searches release it).
+        Later searches raise, so callers don't mistake a retired index for an empty one.
+        """
+        with self._docstore_lock:
+            if self._docstore is not None:
+                self._docstore.close()
+                self._docstore = None
+        self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self.norms = np.zeros(0, dtype=np.float32)
+        self.ntotal = 0
+
+
+def _write_policy_manifest(folder: str, manifest: dict):
+    path = _policy_manifest_path(folder)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(f"{path}.tmp", path)
+
+
+@contextmanager
+def policy_index_file_lock():
+    """
+    Exclusive OS-level lock serializing index writers across processes (app workers,
+    migrate_vectors.py index). Released by the OS if the holder dies.
+    """
+    os.makedirs(POLICY_INDEX_DIR, exist_ok=True)
+    with open(os.path.join(POLICY_INDEX_DIR, ".lock"), "a+b") as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK gives up after ~10s; keep waiting like flock
+                    continue
         try:
-            embeddings = OllamaEmbeddings(model=EMBEDDING_MODEL, base_url=OLLAMA_BASE_URL)
-            
-            if os.path.exists(FAISS_PATH):
-                db = FAISS.load_local(FAISS_PATH, embeddings)
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
             else:
-                docs = _load_documents()
-                if not docs:
-                    return None
-                chunks = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200).split_documents(docs)
-                db = FAISS.from_documents(chunks, embeddings)
-                db.save_local(FAISS_PATH)
-            
-            cached_faiss_db = db
-            return db
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _write_policy_pointer(version: int):
+    path = os.path.join(POLICY_INDEX_DIR, POLICY_INDEX_POINTER)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        f.write(f"v{version}")
+    os.replace(f"{path}.tmp", path)
+
+
+def _prune_policy_versions():
+    """
+    Delete all but the newest POLICY_INDEX_KEEP_VERSIONS version directories. Other workers
+    serve the previous version until their next recheck; files still open elsewhere
+    (Windows refuses to delete those) are retried after the next publish.
+    """
+    for version in _policy_versions_on_disk()[:-POLICY_INDEX_KEEP_VERSIONS]:
+        shutil.rmtree(_policy_version_dir(version), ignore_errors=True)
+
+
+def _write_policy_index(builder: PolicyIndexBuilder, manifest: dict) -> bool:
+    """
+    Write index + manifest to a private staging directory, rename it to v<version>/ and
+    point CURRENT at it. Nothing that is already published is renamed or overwritten.
+    Caller holds policy_index_file_lock. Returns False (nothing published) if the
+    on-disk index is already at or past manifest["version"].
+    """
+    os.makedirs(POLICY_INDEX_DIR, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=POLICY_INDEX_DIR)
+    try:
+        builder.write(staging)
+        _write_policy_manifest(staging, manifest)
+        on_disk = load_policy_manifest().get("version", 0)
+        if on_disk >= manifest["version"]:
+            logger.warning(f"Policy index v{on_disk} already on disk; discarding v{manifest['version']}")
+            return False
+        target = _policy_version_dir(manifest["version"])
+        shutil.rmtree(target, ignore_errors=True)  # Left by a build that never got published
+        os.replace(staging, target)
+        _write_policy_pointer(manifest["version"])
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    _prune_policy_versions()
+    return True
+
+
+def _open_policy_index(folder: Optional[str] = None) -> Optional[MappedPolicyIndex]:
+    folder = folder or current_policy_index_dir()
+    if folder is None or not os.path.exists(os.path.join(folder, POLICY_VECTORS_FILE)):
+        return None
+    return MappedPolicyIndex(folder, OllamaGatewayEmbeddings(EMBEDDING_MODEL))
+
+
+def _publish_policy_index(db: Optional[MappedPolicyIndex], manifest: dict):
+    """
+    Swap the live index in one assignment; searches in flight keep the old object.
+    The replaced index is closed one publish later, once those searches are long done.
+    """
+    global cached_faiss_db, _policy_manifest, _retired_policy_index
+    if db is not None and not db.ntotal:
+        db.close()
+        db = None
+    stale, _retired_policy_index = _retired_policy_index, cached_faiss_db
+    cached_faiss_db = db
+    _policy_manifest = manifest
+    if stale is not None:
+        stale.close()
+
+
+def sync_policy_index(force: bool = False) -> dict:
+    """
+    Bring the policy index in line with documents/: embed only new or changed PDFs,
+    delete chunks of removed/changed ones, persist, and swap the in-memory index.
+    When nothing changed this only stats the PDFs and maps the existing files.
+    """
+    with _policy_index_build_lock, policy_index_file_lock():
+        started = time.perf_counter()
+        current = current_policy_index_dir()
+        manifest = load_policy_manifest(current)  # Read under the file lock: another process may just have synced
+        
+        reusable = (
+            not force
+            and manifest.get("format") == POLICY_INDEX_FORMAT
+            and manifest.get("dim") == EXPECTED_EMBEDDING_DIM
+        )
+        if not reusable:
+            if current is not None and not force:
+                logger.info("Policy index missing, outdated or built for another EMBEDDING_DIM; rebuilding")
+            # Never reuse a version number that may still have a directory on disk
+            version = max([manifest.get("version", 0)] + _policy_versions_on_disk())
+            manifest = {"version": version, "files": {}, "documents": {}}
+        
+        files = scan_policy_documents(manifest["files"])
+        wanted = {}
+        for rel, info in files.items():
+            wanted.setdefault(info["sha256"], rel)
+        documents = dict(manifest["documents"])
+        stale = [sha for sha in documents if sha not in wanted]
+        added = [sha for sha in wanted if sha not in documents]
+        removed_chunks = [cid for sha in stale for cid in documents.pop(sha)["chunk_ids"]]
+        
+        changed = bool(stale or added) or not reusable
+        if changed:
+            builder = PolicyIndexBuilder.load(current) if reusable else PolicyIndexBuilder()
+            if removed_chunks:
+                builder.delete(removed_chunks)
+            ingested = ingest_policy_documents(builder, [(sha, wanted[sha]) for sha in added])
+            documents.update(ingested)
+            # PDFs that failed to parse alone don't make a new version; they're retried next sync
+            changed = bool(stale or ingested) or not reusable
+        
+        if changed or files != manifest["files"]:
+            manifest = {
+                "format": POLICY_INDEX_FORMAT,
+                "version": manifest["version"] + (1 if changed else 0),
+                "dim": EXPECTED_EMBEDDING_DIM,
+                "built_at": datetime.utcnow().isoformat() if changed else manifest.get("built_at"),
+                "files": files,
+                "documents": documents,
+            }
+            if changed:
+                if not _write_policy_index(builder, manifest):
+                    manifest = load_policy_manifest()
+            else:
+                _write_policy_manifest(current, manifest)  # Only size/mtime bookkeeping moved
+        
+        _publish_policy_index(_open_policy_index(), manifest)
+        try:
+            materialize_policy_contexts(cached_faiss_db, policy_index_build(manifest))
         except Exception as e:
-            logger.error(f"FAISS error: {e}")
-            return None
+            logger.error(f"Policy context materialization failed: {e}")
+        summary = {
+            "version": manifest["version"],
+            "added": [wanted[sha] for sha in added if sha in documents],
+            "failed": [wanted[sha] for sha in added if sha not in documents],
+            "removed_chunks": len(removed_chunks),
+            "chunks": cached_faiss_db.ntotal if cached_faiss_db is not None else 0,
+            "seconds": round(time.perf_counter() - started, 2),
+        }
+        logger.info(f"Policy index synced: {summary}")
+        return summary
 
 
-def _load_documents():
-    """Load PDFs from documents/ folder."""
-    if not os.path.exists("documents"):
-        os.makedirs("documents")
-        return []
+def get_policy_index_version() -> int:
+    """Version of the live policy index; bumps whenever its chunks change."""
+    return (_policy_manifest or {}).get("version", 0)
+
+
+def policy_index_build(manifest: Optional[dict] = None) -> str:
+    """
+    Identifies one index build. The version counter restarts at v1 when policy_index/
+    is wiped, so built_at is part of the key: caches keyed on it never outlive their build.
+    """
+    manifest = (_policy_manifest or {}) if manifest is None else manifest
+    return f"v{manifest.get('version', 0)}:{manifest.get('built_at')}"
+
+
+def _recheck_policy_index():
+    """Reload an index another worker built, or sync if documents/ changed on disk."""
     try:
-        loader = DirectoryLoader("documents", glob="**/*.pdf", loader_cls=PyPDFLoader)
-        return loader.load()
+        folder = current_policy_index_dir()
+        on_disk = load_policy_manifest(folder) if folder else {}
+        if (on_disk.get("version", 0) > get_policy_index_version()
+                and on_disk.get("format") == POLICY_INDEX_FORMAT and on_disk.get("dim") == EXPECTED_EMBEDDING_DIM):
+            # A published version's index files never change, so reading one needs no file lock
+            with _policy_index_build_lock:
+                _publish_policy_index(_open_policy_index(folder), on_disk)
+            logger.info(f"Policy index reloaded at version {on_disk['version']}")
+            materialize_policy_contexts(cached_faiss_db, policy_index_build(on_disk))
+        elif scan_policy_documents(_policy_manifest.get("files", {})) != _policy_manifest.get("files"):
+            sync_policy_index()
     except Exception as e:
-        logger.error(f"Document loading error: {e}")
-        return []
+        logger.error(f"Policy index recheck failed: {e}")
+
+
+def get_faiss_db():
+    """
+    Live policy index. The first call builds or updates it (blocking); afterwards
+    documents/ is re-checked in the background every POLICY_INDEX_CHECK_SECONDS.
+    """
+    global _policy_index_checked_at
+    
+    if _policy_manifest is None:
+        with _cache_lock:
+            if _policy_manifest is None:
+                try:
+                    sync_policy_index()
+                except Exception as e:
+                    logger.error(f"Policy index error: {e}")
+                    return None
+                _policy_index_checked_at = time.monotonic()
+        return cached_faiss_db
+    
+    if time.monotonic() - _policy_index_checked_at > POLICY_INDEX_CHECK_SECONDS:
+        _policy_index_checked_at = time.monotonic()
+        threading.Thread(target=_recheck_policy_index, name="policy-index-recheck", daemon=True).start()
+    return cached_faiss_db
+
 
+def _search_policy_context(db, search_query: str) -> str:
+    results = db.similarity_search(search_query, k=3)
+    return "\n\n".join([r.page_content for r in results])
 
-def get_cached_context(cache_key: str, search_query: str) -> str:
-    """Retrieve RAG context with DB-level caching (5-min TTL)."""
+
+def materialize_policy_contexts(db=None, build: Optional[str] = None) -> dict:
+    """
+    Compute every fixed policy context for one index build and publish them in process
+    memory. Results are also stored in context_cache keyed by policy_index_build(), so
+    other workers load them instead of re-running the policy searches.
+    """
+    global _policy_contexts
+    db = db if db is not None else cached_faiss_db
+    build = policy_index_build() if build is None else build
+    if db is None:
+        contexts = {key: "No policy documents available." for key in POLICY_CONTEXT_QUERIES}
+        _policy_contexts = {"build": build, "contexts": contexts}
+        return contexts
+    
+    contexts = {}
+    stored = {}
     try:
         with get_db() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT content, created_at FROM context_cache WHERE cache_key = ?", (cache_key,))
-            row = cursor.fetchone()
-            if row:
-                created = datetime.fromisoformat(row["created_at"])
-                if datetime.utcnow() - created < timedelta(seconds=CACHE_TTL_SECONDS):
-                    return row["content"]
-            
-            db = get_faiss_db()
-            if not db:
-                return "No policy documents available."
-            
-            results = db.similarity_search(search_query, k=3)
-            content = "\n\n".join([r.page_content for r in results])
-            
-            cursor.execute(
-                "INSERT OR REPLACE INTO context_cache (cache_key, content, created_at) VALUES (?, ?, ?)",
-                (cache_key, content, datetime.utcnow().isoformat()),
-            )
-            conn.commit()
-            return content
-        
+            for key in POLICY_CONTEXT_QUERIES:
+                row = conn.execute(
+                    "SELECT content FROM context_cache WHERE cache_key = ?", (f"{key}@{build}",)
+                ).fetchone()
+                if row:
+                    stored[key] = row["content"]
     except Exception as e:
-        logger.error(f"Context cache error: {e}")
-        db = get_faiss_db()
-        if db:
-            results = db.similarity_search(search_query, k=3)
-            return "\n\n".join([r.page_content for r in results])
-        return "Error retrieving policy context."
+        logger.debug(f"Context cache read skipped: {e}")
+    
+    for key, search_query in POLICY_CONTEXT_QUERIES.items():
+        contexts[key] = stored.get(key) or _search_policy_context(db, search_query)
+    
+    if len(stored) < len(POLICY_CONTEXT_QUERIES):
+        try:
+            with get_db() as conn:
+                for key, content in contexts.items():
+                    conn.execute(
+                        "INSERT OR REPLACE INTO context_cache (cache_key, content, created_at) VALUES (?, ?, ?)",
+                        (f"{key}@{build}", content, datetime.utcnow().isoformat()),
+                    )
+                    conn.execute(
+                        "DELETE FROM context_cache WHERE cache_key LIKE ? AND cache_key != ?",
+                        (f"{key}@%", f"{key}@{build}"),
+                    )
+                conn.commit()
+        except Exception as e:
+            logger.debug(f"Context cache write skipped: {e}")
+    
+    if build == policy_index_build():
+        _policy_contexts = {"build": build, "contexts": contexts}
+    logger.info(f"Policy contexts materialized for index {build} ({len(stored)} from context_cache)")
+    return contexts
+
+
+def get_policy_context(key: str) -> str:
+    """Hot path: a dict lookup unless the policy index was rebuilt since the last materialization."""
+    get_faiss_db()  # First-use build and periodic document re-check
+    materialized = _policy_contexts
+    if materialized is None or materialized["build"] != policy_index_build():
+        with _policy_contexts_lock:
+            materialized = _policy_contexts
+            if materialized is None or materialized["build"] != policy_index_build():
+                try:
+                    return materialize_policy_contexts()[key]
+                except Exception as e:
+                    logger.error(f"Policy context error: {e}")
+                    return "Error retrieving policy context."
+    return materialized["contexts"][key]
 
 
 def get_claim_approval_context():
-    return get_cached_context("claim_approval", "What are the documents required for claim approval?")
+    return get_policy_context("claim_approval")
 
 
 def get_general_exclusion_context():
-    return get_cached_context("general_exclusions", "Give a list of all general exclusions")
+    return get_policy_context("general_exclusions")
+
+
+def _normalize_diagnosis(disease: str) -> str:
+    return " ".join((disease or "").lower().split())
+
+
+def get_claim_policy_context(disease: str, icd10_code: str = "") -> str:
+    """
+    Policy text about this claim's diagnosis, packed into CLAIM_CONTEXT_TOKEN_BUDGET.
+    Results are memoized per (normalized diagnosis, ICD-10 code, index version). The
+    query vector comes from get_embedding's cache, so repeat diagnoses cost nothing.
+    """
+    diagnosis = _normalize_diagnosis(disease)
+    code = (icd10_code or "").strip().upper()
+    if code in ("UNKNOWN", "N/A", "NONE"):
+        code = ""
+    if not diagnosis or diagnosis == "unknown":
+        return ""
+    
+    db = get_faiss_db()
+    if db is None:
+        return ""
+    key = (diagnosis, code, get_policy_index_version())
+    with _claim_context_lock:
+        context = _claim_context_lru.get(key)
+        if context is not None:
+            _claim_context_lru.move_to_end(key)
+            _claim_context_stats["hits"] += 1
+            return context
+    
+    query = f"Coverage, exclusions and claim requirements for {diagnosis}"
+    if code:
+        query += f" (ICD-10 {code})"
+    try:
+        results = db.similarity_search_by_vector(get_embedding(query), k=CLAIM_CONTEXT_K)
+    except Exception as e:
+        logger.error(f"Claim policy retrieval error: {e}")
+        return ""
+    
+    # Greedy packing: best chunks first, the last one trimmed to the remaining budget
+    parts, seen, remaining = [], set(), CLAIM_CONTEXT_TOKEN_BUDGET
+    for doc in results:
+        if remaining < 32:  # Not worth a fragment
+            break
+        text = sanitize_for_llm(doc.page_content)
+        if text in seen:
+            continue
+        seen.add(text)
+        if _estimate_tokens(text) > remaining:
+            text = text[:(remaining - 2) * 4].rsplit(" ", 1)[0] + " ..."
+        parts.append(text)
+        remaining -= _estimate_tokens(text) + 1
+    context = "\n---\n".join(parts)
+    
+    with _claim_context_lock:
+        _claim_context_stats["misses"] += 1
+        if not context:
+            return context  # Nothing retrieved; don't pin that for the rest of this index version
+        _claim_context_lru[key] = context
+        while len(_claim_context_lru) > CLAIM_CONTEXT_LRU_SIZE:
+            _claim_context_lru.popitem(last=False)
+    return context
+
+
+def get_claim_context_stats() -> dict:
+    with _claim_context_lock:
+        stats = dict(_claim_context_stats)
+        stats["entries"] = len(_claim_context_lru)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = round(stats["hits"] / lookups, 3) if lookups else None
+    return stats
 
 
 # ============================================================================
@@ -421,12 +1904,55 @@ def sanitize_for_llm(text) -> str:
     return text if text.strip() else "N/A"
 
 
+class BillInfo(TypedDict):
+    disease: str
+    expense: Optional[int]
+    icd10_code: str
+
+
+# JSON schema passed to Ollama's `format` so the model can only emit this object
+BILL_INFO_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "disease": {"type": "string"},
+        "expense": {"type": ["number", "null"]},
+        "icd10_code": {"type": "string"},
+    },
+    "required": ["disease", "expense", "icd10_code"],
+}
+
+
+def _parse_amount(value) -> Optional[int]:
+    """Coerce an amount like 3150, "3,150.00" or "Rs 3150" to whole rupees."""
+    if value is None or value == "":
+        return None
+    try:
+        cleaned = re.sub(r'[^\d.]', '', str(value))
+        return int(float(cleaned)) if cleaned else None
+    except (ValueError, TypeError):
+        return None
+
+
+def validate_bill_info(data) -> BillInfo:
+    """Validate model output into a BillInfo; raises ValueError if it is unusable."""
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected a JSON object, got {type(data).__name__}")
+    disease = str(data.get("disease") or "").strip()
+    if not disease:
+        raise ValueError("Missing disease")
+    return {
+        "disease": disease,
+        "expense": _parse_amount(data.get("expense")),
+        "icd10_code": str(data.get("icd10_code") or "Unknown").strip() or "Unknown",
+    }
+
+
 def extract_bill_info(bill_text: str) -> dict:
-    """Use LLM to extract disease and expense from bill text."""
+    """Use LLM (schema-constrained JSON output) to extract disease and expense from bill text."""
     try:
         safe_bill_text = sanitize_for_llm(bill_text[:2000])
         
-        response = chat(
+        response = ollama_chat(
             model=FAST_MODEL,
             messages=[
                 {
@@ -438,44 +1964,208 @@ def extract_bill_info(bill_text: str) -> dict:
                     "content": f"Extract from this bill:\n{safe_bill_text}",
                 },
             ],
+            format=BILL_INFO_SCHEMA,
             options={"temperature": 0.1},
         )
         text = response["message"]["content"]
-        match = re.search(r"\{[^}]+\}", text)
-        if match:
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            # Older Ollama servers ignore `format`; salvage the first object
+            match = re.search(r"\{[^}]+\}", text)
+            if not match:
+                raise
             data = json.loads(match.group())
-            if data.get("expense"):
-                try:
-                    expense_str = str(data["expense"])
-                    expense_clean = re.sub(r'[^\d.]', '', expense_str)
-                    if expense_clean:
-                        data["expense"] = int(float(expense_clean))
-                    else:
-                        data["expense"] = None
-                except (ValueError, TypeError):
-                    data["expense"] = None
-            return data
+        return validate_bill_info(data)
     except Exception as e:
         logger.error(f"Bill extraction error: {e}")
     return {"disease": "Unknown", "expense": None}
 
 
+# ============================================================================
+# EXTRACTION CACHE (content-addressed by upload hash)
+# ============================================================================
+
+def extraction_cache_version() -> str:
+    """Identifies the extraction pipeline; entries from other versions are never served."""
+    return f"{EXTRACTION_CACHE_SCHEMA}:{FAST_MODEL}:{VISION_MODEL}"
+
+
+def get_cached_extraction(content_hash: str):
+    """Return (bill_text, bill_info) for a previously seen upload, or None."""
+    try:
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT bill_text, bill_info FROM extraction_cache WHERE content_hash = ? AND extractor_version = ?",
+                (content_hash, extraction_cache_version()),
+            )
+            row = cursor.fetchone()
+            if not row:
+                return None
+            cursor.execute(
+                "UPDATE extraction_cache SET last_used_at = ? WHERE content_hash = ?",
+                (datetime.utcnow().isoformat(), content_hash),
+            )
+            conn.commit()
+            return row["bill_text"], json.loads(row["bill_info"])
+    except Exception as e:
+        logger.error(f"Extraction cache read error: {e}")
+        return None
+
+
+def store_cached_extraction(content_hash: str, bill_text: str, bill_info: dict):
+    """Persist extraction results and evict least-recently-used entries over the bound."""
+    if not bill_text or bill_info.get("disease") in (None, "", "Unknown"):
+        return  # Don't pin failed extractions; a retry may succeed
+    try:
+        with get_db() as conn:
+            cursor = conn.cursor()
+            now = datetime.utcnow().isoformat()
+            cursor.execute(
+                """INSERT OR REPLACE INTO extraction_cache
+                (content_hash, extractor_version, bill_text, bill_info, created_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?, ?)""",
+                (content_hash, extraction_cache_version(), bill_text, json.dumps(bill_info), now, now),
+            )
+            cursor.execute(
+                """DELETE FROM extraction_cache WHERE content_hash IN (
+                    SELECT content_hash FROM extraction_cache
+                    ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                )""",
+                (EXTRACTION_CACHE_MAX_ENTRIES,),
+            )
+            conn.commit()
+    except Exception as e:
+        logger.error(f"Extraction cache write error: {e}")
+
+
+def invalidate_extraction_cache(stale_only: bool = False) -> int:
+    """
+    Invalidation hook for model/prompt changes.
+    stale_only=True drops only entries from other extractor versions.
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        if stale_only:
+            cursor.execute(
+                "DELETE FROM extraction_cache WHERE extractor_version != ?",
+                (extraction_cache_version(),),
+            )
+        else:
+            cursor.execute("DELETE FROM extraction_cache")
+        conn.commit()
+        removed = cursor.rowcount
+    logger.info(f"Invalidated {removed} extraction cache entries")
+    return removed
+
+
 # ============================================================================
 # FRAUD DETECTION
 # ============================================================================
 
+def _exclusion_fingerprint(conn) -> tuple:
+    return tuple(conn.execute("SELECT COUNT(*), COALESCE(MAX(id), 0), COALESCE(SUM(id), 0) FROM exclusions").fetchone())
+
+
+def refresh_exclusion_index():
+    """
+    Rebuild the in-memory exclusion matcher: a row-normalized float32 matrix of the
+    exclusion embeddings plus the matching names. The new index replaces the old
+    one in a single reference swap, so readers never see a partial build.
+    """
+    global _exclusion_index
+    with _exclusion_index_lock:
+        with get_db() as conn:
+            fingerprint = _exclusion_fingerprint(conn)
+            names = {row["id"]: row["name"] for row in conn.execute("SELECT id, name FROM exclusions")}
+            vec_rows = conn.execute("SELECT exclusion_id, embedding FROM exclusions_vec").fetchall()
+        
+        kept_names, vectors = [], []
+        for row in vec_rows:
+            if row["exclusion_id"] in names:
+                kept_names.append(names[row["exclusion_id"]])
+                vectors.append(np.frombuffer(row["embedding"], dtype=np.float32))
+        
+        if vectors:
+            matrix = np.vstack(vectors)
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        else:
+            matrix = np.zeros((0, EXPECTED_EMBEDDING_DIM), dtype=np.float32)
+        
+        _exclusion_index = {
+            "names": np.array(kept_names, dtype=object),
+            "matrix": matrix,
+            "fingerprint": fingerprint,
+            "checked_at": time.monotonic(),
+        }
+        logger.info(f"Exclusion index rebuilt: {len(kept_names)} exclusions")
+        return _exclusion_index
+
+
+def get_exclusion_index():
+    """Current exclusion index, built lazily; periodically checks for edits from other workers."""
+    global _exclusion_index
+    index = _exclusion_index
+    try:
+        if index is None:
+            return refresh_exclusion_index()
+        if time.monotonic() - index["checked_at"] > EXCLUSION_INDEX_CHECK_SECONDS:
+            with get_db() as conn:
+                fingerprint = _exclusion_fingerprint(conn)
+            if fingerprint != index["fingerprint"]:
+                return refresh_exclusion_index()
+            _exclusion_index = {**index, "checked_at": time.monotonic()}
+        return index
+    except Exception as e:
+        logger.error(f"Exclusion index unavailable: {e}")
+        return index
+
+
+def match_exclusions(index: dict, disease: str, disease_vec: list) -> list:
+    """All exclusions above the threshold, via one matrix-vector product."""
+    if not len(index["names"]):
+        return []
+    query = np.asarray(disease_vec, dtype=np.float32)
+    query /= max(float(np.linalg.norm(query)), 1e-12)
+    similarities = index["matrix"] @ query * 100
+    
+    violations = []
+    for i in np.argsort(-similarities)[:10]:
+        similarity = float(similarities[i])
+        if similarity <= EXCLUSION_SIMILARITY_THRESHOLD:
+            break
+        violations.append({
+            "exclusion": index["names"][i],
+            "similarity": round(similarity, 1),
+            "disease_mentioned": disease,
+        })
+    return violations
+
+
 def check_policy_violations(disease: str) -> list:
-    """Check disease against pre-computed exclusion embeddings via sqlite-vec."""
+    """
+    Check disease against pre-computed exclusion embeddings.
+    Uses the in-memory matrix; the sqlite-vec KNN query is only a cold-start fallback.
+    """
     if not disease or not sqlite_vec:
         return _fallback_exclusion_check(disease)
     
     try:
-        response = embed(model=EMBEDDING_MODEL, input=disease.lower())
-        disease_vec = response["embeddings"][0]
+        disease_vec = get_embedding(disease.lower())
     except Exception as e:
         logger.error(f"Disease embedding failed: {e}")
         return _fallback_exclusion_check(disease)
     
+    index = get_exclusion_index()
+    if index is not None:
+        try:
+            return match_exclusions(index, disease, disease_vec)
+        except Exception as e:
+            # e.g. EMBEDDING_DIM changed but migrate_vectors.py reembed hasn't run yet
+            logger.error(f"Exclusion matrix check error: {e}")
+            return _fallback_exclusion_check(disease)
+    
     violations = []
     try:
         with get_db() as conn:
@@ -506,7 +2196,7 @@ def check_policy_violations(disease: str) -> list:
                 distance = vec_row["distance"]
                 similarity = max(0, 1 - (distance ** 2) / 2) * 100
                 
-                if similarity > 75:
+                if similarity > EXCLUSION_SIMILARITY_THRESHOLD:
                     violations.append({
                         "exclusion": excl_row["name"],
                         "similarity": round(similarity, 1),
@@ -536,15 +2226,112 @@ def _fallback_exclusion_check(disease: str) -> list:
     return violations
 
 
+def find_duplicate_candidates(conn, claim_data: dict) -> list:
+    """
+    Prior claims that could be duplicates: same patient within DUPLICATE_LOOKBACK_DAYS,
+    or any claim on the same date. Every scoring combination that reaches the duplicate
+    threshold includes one of those two signals, so nothing else needs to be ranked.
+    Both arms are served by idx_claims_patient_lower_date / idx_claims_date. The
+    same-patient arm is always returned in full; only the other patients' same-date
+    claims are capped at DUPLICATE_MAX_CANDIDATES, so a busy day can't crowd out history.
+    """
+    patient_name = (claim_data.get("patient_name") or "").strip().lower()
+    claim_date = claim_data.get("date") or ""
+    try:
+        anchor = datetime.strptime(claim_date, "%Y-%m-%d")
+    except (ValueError, TypeError):
+        anchor, claim_date = datetime.now(), ""
+    since = (anchor - timedelta(days=DUPLICATE_LOOKBACK_DAYS)).strftime("%Y-%m-%d")
+    until = (anchor + timedelta(days=DUPLICATE_LOOKBACK_DAYS)).strftime("%Y-%m-%d")
+    
+    return conn.execute(
+        """
+        SELECT id, patient_name, diagnosis, amount, date FROM claims
+        WHERE LOWER(patient_name) = ? AND date BETWEEN ? AND ?
+        UNION ALL
+        SELECT * FROM (
+            SELECT id, patient_name, diagnosis, amount, date FROM claims
+            WHERE date = ? AND LOWER(patient_name) IS NOT ?
+            ORDER BY rowid DESC
+            LIMIT ?
+        )
+        """,
+        (patient_name, since, until, claim_date, patient_name, DUPLICATE_MAX_CANDIDATES),
+    ).fetchall()
+
+
+def load_claim_vectors(conn, claim_ids: list) -> dict:
+    """Diagnosis embeddings for the given claims in one statement (vec0 point lookups)."""
+    if not claim_ids:
+        return {}
+    placeholders = ",".join("?" * len(claim_ids))
+    rows = conn.execute(
+        f"SELECT claim_id, diagnosis_embedding FROM claims_vec WHERE claim_id IN ({placeholders})",
+        claim_ids,
+    ).fetchall()
+    return {row["claim_id"]: np.frombuffer(row["diagnosis_embedding"], dtype=np.float32) for row in rows}
+
+
+def load_claim_codes(conn, claim_ids: list) -> dict:
+    """int8 diagnosis codes for the given claims from claims_vec_q8, in one query."""
+    if not claim_ids:
+        return {}
+    placeholders = ",".join("?" * len(claim_ids))
+    rows = conn.execute(
+        f"SELECT claim_id, code FROM claims_vec_q8 WHERE claim_id IN ({placeholders})",
+        claim_ids,
+    ).fetchall()
+    return {row["claim_id"]: np.frombuffer(row["code"], dtype=np.int8) for row in rows}
+
+
+def _cosine(matrix: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Cosine similarity of each row against a unit-norm query, clipped at 0."""
+    matrix = matrix.astype(np.float32)
+    norms = np.maximum(np.linalg.norm(matrix, axis=1), 1e-12)
+    return np.maximum(matrix @ query / norms, 0.0)
+
+
+def rank_claim_diagnoses(conn, claim_ids: list, query: np.ndarray) -> dict:
+    """
+    Diagnosis similarity (0-1) for each candidate claim.
+    With DUPLICATE_QUANTIZED_INDEX the int8 codes are scored first and only the top
+    DUPLICATE_RERANK_K are re-scored exactly against claims_vec; the rest keep their
+    coarse score, which is within about a percent of the float cosine.
+    """
+    similarities = {}
+    if DUPLICATE_QUANTIZED_INDEX and claim_ids:
+        codes = load_claim_codes(conn, claim_ids)
+        if codes:
+            coded_ids = list(codes)
+            coarse = _cosine(np.vstack([codes[cid] for cid in coded_ids]), query)
+            similarities = dict(zip(coded_ids, coarse.tolist()))
+            order = np.argsort(-coarse)[:DUPLICATE_RERANK_K]
+            exact_ids = [coded_ids[i] for i in order]
+            exact_ids += [cid for cid in claim_ids if cid not in codes]  # Not backfilled yet
+        else:
+            exact_ids = claim_ids
+    else:
+        exact_ids = claim_ids
+    
+    vectors = load_claim_vectors(conn, exact_ids)
+    if vectors:
+        exact_ids = list(vectors)
+        exact = _cosine(np.vstack([vectors[cid] for cid in exact_ids]), query)
+        similarities.update(zip(exact_ids, exact.tolist()))
+    return similarities
+
+
 def detect_duplicates(claim_data: dict, threshold: float = 0.7) -> list:
-    """Detect duplicate claims using vector similarity in sqlite-vec."""
+    """
+    Detect duplicate claims: prefilter history by patient and date with an index,
+    then rank the candidates by diagnosis similarity.
+    """
     diagnosis = claim_data.get("diagnosis", "")
     if not diagnosis or not sqlite_vec:
         return []
     
     try:
-        response = embed(model=EMBEDDING_MODEL, input=diagnosis.lower())
-        diag_vec = response["embeddings"][0]
+        diag_vec = get_embedding(diagnosis.lower())
     except Exception as e:
         logger.error(f"Diagnosis embedding failed: {e}")
         return []
@@ -552,84 +2339,67 @@ def detect_duplicates(claim_data: dict, threshold: float = 0.7) -> list:
     duplicates = []
     try:
         with get_db() as conn:
-            cursor = conn.cursor()
-            
-            # FIXED: Separate vector query from JOIN (sqlite-vec limitation)
-            cursor.execute(
-                """
-                SELECT claim_id, distance
-                FROM claims_vec
-                WHERE diagnosis_embedding MATCH ?
-                AND k = ?
-                ORDER BY distance
-                """,
-                (serialize_f32(diag_vec), 10,),
-            )
-            vec_rows = cursor.fetchall()
-            
-            patient_name = claim_data.get("patient_name", "").lower()
-            claimed_amount = Decimal(str(claim_data.get("amount", 0) or 0))
+            query = np.asarray(diag_vec, dtype=np.float32)
+            query /= max(float(np.linalg.norm(query)), 1e-12)
+            candidates = find_duplicate_candidates(conn, claim_data)
+            similarities = rank_claim_diagnoses(conn, [row["id"] for row in candidates], query)
+        
+        patient_name = claim_data.get("patient_name", "").lower()
+        claimed_amount = Decimal(str(claim_data.get("amount", 0) or 0))
+        
+        for claim_row in candidates:
+            score = 0
+            reasons = []
             
-            for vec_row in vec_rows:
-                cursor.execute(
-                    "SELECT patient_name, diagnosis, amount, date FROM claims WHERE id = ?",
-                    (vec_row["claim_id"],),
-                )
-                claim_row = cursor.fetchone()
-                if not claim_row:
-                    continue
-                
-                score = 0
-                reasons = []
-                distance = vec_row["distance"]
-                diag_similarity = max(0, 1 - (distance ** 2) / 2)
-                
+            diag_similarity = similarities.get(claim_row["id"])
+            if diag_similarity is not None:
                 if diag_similarity > 0.7:
                     score += 0.3
                     reasons.append(f"Similar diagnosis ({diag_similarity:.0%} match)")
+            
+            if claim_row["patient_name"] and claim_row["patient_name"].lower() == patient_name:
+                score += 0.3
+                reasons.append("Same patient")
+            
+            try:
+                hist_amt = Decimal(str(claim_row["amount"] or 0))
+                if claimed_amount > 0 and hist_amt > 0:
+                    variance = abs(claimed_amount - hist_amt) / max(claimed_amount, hist_amt)
+                    if variance < Decimal('0.05'):
+                        score += 0.2
+                        reasons.append(f"Near identical amount ({float(variance):.0%} variance)")
+            except (ValueError, TypeError):
+                pass
+            
+            try:
+                claim_date = claim_data.get("date", "")
+                if claim_date and claim_row["date"]:
+                    d1 = datetime.strptime(claim_date, "%Y-%m-%d")
+                    d2 = datetime.strptime(claim_row["date"], "%Y-%m-%d")
+                    days_apart = abs((d1 - d2).days)
+                    if days_apart == 0:
+                        score += 0.3
+                        reasons.append("Same date")
+                    elif days_apart < 30:
+                        score -= 0.1
+                        reasons.append(f"Likely follow-up ({days_apart}d apart)")
+            except (ValueError, TypeError):
+                pass
+            
+            if score >= threshold:
+                duplicates.append({
+                    "claim_id": claim_row["id"],
+                    "confidence": min(100.0, round(score * 100, 1)),
+                    "reasons": reasons,
+                    "diagnosis": claim_row["diagnosis"],
+                    "amount": claim_row["amount"],
+                })
                 
-                if claim_row["patient_name"] and claim_row["patient_name"].lower() == patient_name:
-                    score += 0.3
-                    reasons.append("Same patient")
-                
-                try:
-                    hist_amt = Decimal(str(claim_row["amount"] or 0))
-                    if claimed_amount > 0 and hist_amt > 0:
-                        variance = abs(claimed_amount - hist_amt) / max(claimed_amount, hist_amt)
-                        if variance < Decimal('0.05'):
-                            score += 0.2
-                            reasons.append(f"Near identical amount ({float(variance):.0%} variance)")
-                except (ValueError, TypeError):
-                    pass
-                
-                try:
-                    claim_date = claim_data.get("date", "")
-                    if claim_date and claim_row["date"]:
-                        d1 = datetime.strptime(claim_date, "%Y-%m-%d")
-                        d2 = datetime.strptime(claim_row["date"], "%Y-%m-%d")
-                        days_apart = abs((d1 - d2).days)
-                        if days_apart == 0:
-                            score += 0.3
-                            reasons.append("Same date")
-                        elif days_apart < 30:
-                            score -= 0.1
-                            reasons.append(f"Likely follow-up ({days_apart}d apart)")
-                except (ValueError, TypeError):
-                    pass
-                
-                if score >= threshold:
-                    duplicates.append({
-                        "claim_id": vec_row["claim_id"],
-                        "confidence": min(100.0, round(score * 100, 1)),
-                        "reasons": reasons,
-                        "diagnosis": claim_row["diagnosis"],
-                        "amount": claim_row["amount"],
-                    })
-                    
     except Exception as e:
         logger.error(f"Duplicate detection error: {e}")
     
-    return duplicates
+    duplicates.sort(key=lambda d: d["confidence"], reverse=True)
+    return duplicates[:10]
 
 
 def detect_fraud_ring(claim_data: dict) -> list:
@@ -771,27 +2541,9 @@ def comprehensive_fraud_check(claim_data: dict, bill_info: dict) -> dict:
 # LLM DECISION (IMPROVED PROMPT WITH EXAMPLES)
 # ============================================================================
 
-IMPROVED_DECISION_PROMPT = """You are an insurance claims adjudication AI. Analyze the claim data and return a structured JSON decision.
-
-# CLAIM INFORMATION
-Patient: {patient_name}
-Type: {claim_type}
-Diagnosis: {disease}
-Claimed Amount: ₹{claimed_amount}
-Billed Amount: ₹{billed_amount}
-Date: {date}
-Facility: {facility}
-
-# FRAUD ANALYSIS RESULTS
-Risk Level: {risk_level} (Score: {risk_score}/10)
-Risk Factors:
-{risk_factors}
-
-# POLICY CONTEXT
-{policy_context}
-
-# EXCLUSION LIST
-{exclusion_context}
+# Static prefix: identical bytes for every claim (given the same policy contexts),
+# so Ollama can reuse its KV cache instead of re-prefilling ~3KB of rules each time.
+DECISION_SYSTEM_PROMPT = """You are an insurance claims adjudication AI. Analyze the claim data provided by the user and return a structured JSON decision. Always respond with valid JSON only.
 
 # DECISION RULES (Apply in order)
 
@@ -922,15 +2674,372 @@ Output:
  ]
 }}
 
+# EXCLUSION LIST
+{exclusion_context}
+
+# POLICY CONTEXT
+{policy_context}
+"""
+
+# Per-claim block, appended after the static prefix as the user message
+IMPROVED_DECISION_PROMPT = """# CLAIM INFORMATION
+Patient: {patient_name}
+Type: {claim_type}
+Diagnosis: {disease}
+Claimed Amount: ₹{claimed_amount}
+Billed Amount: ₹{billed_amount}
+Date: {date}
+Facility: {facility}
+
+# FRAUD ANALYSIS RESULTS
+Risk Level: {risk_level} (Score: {risk_score}/10)
+Risk Factors:
+{risk_factors}
+
+# POLICY TEXT FOR THIS DIAGNOSIS
+{claim_policy_context}
+
 Now analyze the claim above and return your decision in the exact JSON format.
 """
 
 
+def _estimate_tokens(text: str) -> int:
+    """Rough token count (~4 chars/token for llama tokenizers) for prompt accounting."""
+    return len(text) // 4
+
+
+@lru_cache(maxsize=8)
+def build_decision_system_prompt(policy_context: str, exclusion_context: str) -> str:
+    """Render the static prefix; memoized so every claim sends byte-identical text."""
+    return DECISION_SYSTEM_PROMPT.format(
+        policy_context=sanitize_for_llm(policy_context[:1500]),
+        exclusion_context=sanitize_for_llm(exclusion_context[:1000]),
+    )
+
+
+def build_decision_messages(claim_data: dict, bill_info: dict, fraud_report: dict,
+                            policy_context: str, exclusion_context: str,
+                            claim_policy_context: str = "") -> list:
+    """Assemble the decision chat: stable system prefix first, claim-specific block last."""
+    risk_factors_str = "; ".join(fraud_report["risk_factors"]) if fraud_report["risk_factors"] else "None"
+    claim_block = IMPROVED_DECISION_PROMPT.format(
+        patient_name=sanitize_for_llm(claim_data.get("patient_name", "")),
+        claim_type=sanitize_for_llm(claim_data.get("claim_type", "")),
+        disease=sanitize_for_llm(bill_info.get("disease", "Unknown")),
+        claimed_amount=sanitize_for_llm(claim_data.get("amount", 0)),
+        billed_amount=sanitize_for_llm(bill_info.get("expense") or "Unknown"),
+        date=sanitize_for_llm(claim_data.get("date", "")),
+        facility=sanitize_for_llm(claim_data.get("medical_facility", "")),
+        risk_level=sanitize_for_llm(fraud_report["fraud_risk_level"]),
+        risk_score=sanitize_for_llm(fraud_report["risk_score"]),
+        risk_factors=sanitize_for_llm(risk_factors_str),
+        claim_policy_context=claim_policy_context or "No diagnosis-specific policy text found.",
+    )
+    return [
+        {"role": "system", "content": build_decision_system_prompt(policy_context, exclusion_context)},
+        {"role": "user", "content": claim_block},
+    ]
+
+
+def record_prefill(messages: list, final_chunk: dict) -> dict:
+    """
+    Track how many prompt tokens the model actually had to prefill versus the full prompt.
+    With the prefix cached, prompt_eval_count covers roughly the claim block only.
+    """
+    prompt_tokens = sum(_estimate_tokens(m["content"]) for m in messages)
+    prefix_tokens = _estimate_tokens(messages[0]["content"])
+    prefill_tokens = final_chunk.get("prompt_eval_count")
+    with _prompt_stats_lock:
+        _prompt_stats["calls"] += 1
+        _prompt_stats["prompt_tokens_est"] += prompt_tokens
+        if prefill_tokens is not None:
+            _prompt_stats["measured_calls"] += 1
+            _prompt_stats["prefill_tokens"] += prefill_tokens
+            _prompt_stats["measured_prompt_tokens_est"] += prompt_tokens
+    return {
+        "prompt_tokens_est": prompt_tokens,
+        "static_prefix_tokens_est": prefix_tokens,
+        "prefill_tokens": prefill_tokens,
+    }
+
+
+def get_prompt_stats() -> dict:
+    """Aggregate prefill savings across decision calls (for /admin/api/stats)."""
+    with _prompt_stats_lock:
+        stats = dict(_prompt_stats)
+    if stats["measured_prompt_tokens_est"]:
+        stats["prefill_saving_pct"] = round(
+            100 * (1 - stats["prefill_tokens"] / stats["measured_prompt_tokens_est"]), 1
+        )
+    return stats
+
+
+class Decision(TypedDict):
+    status: str
+    approved_amount: float
+    primary_reason: str
+    confidence: str
+    policy_reference: str
+    risk_assessment: str
+    customer_message: str
+    medical_assessment: str
+    next_steps: List[str]
+
+
+DECISION_STATUSES = ("ACCEPTED", "REJECTED", "REQUIRES_REVIEW")
+DECISION_CONFIDENCE = ("HIGH", "MEDIUM", "LOW")
+DECISION_TEXT_FIELDS = (
+    "primary_reason", "policy_reference", "risk_assessment",
+    "customer_message", "medical_assessment",
+)
+
+DECISION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "status": {"type": "string", "enum": list(DECISION_STATUSES)},
+        "approved_amount": {"type": "number"},
+        "primary_reason": {"type": "string"},
+        "confidence": {"type": "string", "enum": list(DECISION_CONFIDENCE)},
+        "policy_reference": {"type": "string"},
+        "risk_assessment": {"type": "string"},
+        "customer_message": {"type": "string"},
+        "medical_assessment": {"type": "string"},
+        "next_steps": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": [
+        "status", "approved_amount", "primary_reason", "confidence", "policy_reference",
+        "risk_assessment", "customer_message", "medical_assessment", "next_steps",
+    ],
+}
+
+
+def validate_decision(data) -> Decision:
+    """Validate a decision object from the LLM; raises ValueError if it can't be used as-is."""
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected a JSON object, got {type(data).__name__}")
+    status = str(data.get("status") or "").strip().upper()
+    if status not in DECISION_STATUSES:
+        raise ValueError(f"Invalid decision status: {status!r}")
+    
+    try:
+        approved_amount = max(0, round(float(data.get("approved_amount") or 0)))
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid approved_amount: {data.get('approved_amount')!r}")
+    if status != "ACCEPTED":
+        approved_amount = 0  # Prompt rules: rejected and review claims approve nothing
+    
+    confidence = str(data.get("confidence") or "").strip().upper()
+    next_steps = data.get("next_steps") or []
+    if isinstance(next_steps, str):
+        next_steps = [next_steps]
+    
+    decision = {
+        "status": status,
+        "approved_amount": approved_amount,
+        "confidence": confidence if confidence in DECISION_CONFIDENCE else "LOW",
+        "next_steps": [str(step) for step in next_steps],
+    }
+    for field in DECISION_TEXT_FIELDS:
+        decision[field] = str(data.get(field) or "")
+    return decision
+
+
+class IncrementalJSONParser:
+    """
+    Parses the first top-level JSON object out of a token stream as it arrives.
+    Top-level "key": value pairs are surfaced as soon as each one is complete,
+    and `result` is set once the closing brace is seen.
+    """
+    
+    def __init__(self):
+        self.buffer = ""
+        self.fields = {}
+        self.result = None
+        self._pos = 0
+        self._start = None
+        self._pair_start = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+    
+    @property
+    def complete(self) -> bool:
+        return self.result is not None
+    
+    def feed(self, delta: str) -> dict:
+        """Consume a chunk; returns the top-level fields completed by it."""
+        self.buffer += delta
+        new_fields = {}
+        while self._pos < len(self.buffer) and not self.complete:
+            ch = self.buffer[self._pos]
+            if self._start is None:
+                if ch == "{":  # Skip any preamble before the object
+                    self._start = self._pos
+                    self._pair_start = self._pos + 1
+                    self._depth = 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    new_fields.update(self._close_pair())
+                    try:
+                        self.result = json.loads(self.buffer[self._start:self._pos + 1])
+                    except json.JSONDecodeError:
+                        self._start = None  # Not valid JSON after all; look for the next object
+            elif ch == "," and self._depth == 1:
+                new_fields.update(self._close_pair())
+                self._pair_start = self._pos + 1
+            self._pos += 1
+        return new_fields
+    
+    def _close_pair(self) -> dict:
+        segment = self.buffer[self._pair_start:self._pos].strip()
+        if not segment:
+            return {}
+        try:
+            pair = json.loads("{" + segment + "}")
+        except json.JSONDecodeError:
+            return {}
+        self.fields.update(pair)
+        return pair
+
+
 # ============================================================================
 # SSE STREAMING CLAIM PROCESSOR (MODIFIED for file saving)
 # ============================================================================
 
-def process_claim_stream(claim_data: dict, bill_content: str, bill_info: dict, file_path: str = None):
+def _rule_decision(status: str, rule: str, reason: str, policy_reference: str,
+                   risk_assessment: str, customer_message: str, next_steps: list) -> dict:
+    return {
+        "status": status,
+        "approved_amount": 0,
+        "primary_reason": reason,
+        "confidence": "HIGH",
+        "policy_reference": policy_reference,
+        "risk_assessment": risk_assessment,
+        "customer_message": customer_message,
+        "medical_assessment": "Not assessed: the claim was settled by a mandatory policy rule.",
+        "next_steps": next_steps,
+        "decided_by": "rules",
+        "rule": rule,
+    }
+
+
+def apply_decision_rules(claim_data: dict, bill_info: dict, fraud_report: dict):
+    """
+    Deterministic fast path for claims the hard rules in DECISION_SYSTEM_PROMPT already settle.
+    Returns a complete decision (same schema as the LLM's) or None if the LLM must decide.
+    """
+    disease = bill_info.get("disease") or "the diagnosed condition"
+    
+    # STEP 1: Exclusion match is a mandatory rejection
+    if fraud_report["policy_violations"]:
+        exclusion = max(fraud_report["policy_violations"], key=lambda v: v["similarity"])["exclusion"]
+        return _rule_decision(
+            "REJECTED", "exclusion",
+            f"'{disease}' matches the policy exclusion '{exclusion}', which is not covered",
+            "Section 4.2, General Exclusions",
+            f"No fraud assessment needed. Diagnosis matches exclusion '{exclusion}'.",
+            f"We regret to inform you that treatment for {disease} is not covered under your current policy, "
+            f"as it falls under the '{exclusion}' exclusion in Section 4.2 of the member handbook. "
+            "Please contact our support team to explore alternative coverage options.",
+            [
+                "Review policy exclusions in member handbook",
+                "Contact support at claims@insurance.com for alternative coverage",
+                "Appeal within 30 days if you believe this is an error",
+            ],
+        )
+    
+    # STEP 2: Claimed amount more than 10% above the bill
+    try:
+        claimed = Decimal(str(claim_data.get("amount", 0) or 0))
+        billed = Decimal(str(bill_info.get("expense", 0) or 0))
+    except (ArithmeticError, ValueError, TypeError):
+        claimed = billed = Decimal(0)
+    if claimed > billed > 0:
+        variance = (claimed - billed) / billed * 100
+        if variance > 10:
+            return _rule_decision(
+                "REJECTED", "amount_variance",
+                f"Amount discrepancy: claimed ₹{claimed:.0f} exceeds billed ₹{billed:.0f} by {variance:.1f}%",
+                "Section 3, Claim Documentation Requirements",
+                f"Claimed amount exceeds the medical bill by {variance:.1f}% (limit 10%).",
+                f"Your claim of ₹{claimed:.0f} could not be approved because it exceeds the billed amount "
+                f"of ₹{billed:.0f} on the submitted medical bill. Please resubmit with the correct amount "
+                "or provide supporting documents for the difference.",
+                [
+                    "Check the claimed amount against your medical bill",
+                    "Resubmit the claim with the billed amount",
+                    "Attach receipts for any additional expenses",
+                ],
+            )
+    
+    # STEP 3: Fraud ring or strong duplicate
+    fraud_ring = [rf for rf in fraud_report["risk_factors"] if "Fraud Ring Risk" in rf]
+    if fraud_ring or fraud_report["duplicate_confidence"] > 70:
+        if fraud_ring:
+            rule, reason = "fraud_ring", fraud_ring[0]
+        else:
+            rule = "duplicate"
+            reason = (
+                f"A highly similar claim ({fraud_report['duplicate_confidence']:.0f}% match) "
+                "was already submitted previously"
+            )
+        return _rule_decision(
+            "REJECTED", rule, reason,
+            "Section 5, Fraud Prevention Policy",
+            "; ".join(fraud_report["risk_factors"]),
+            "Your claim has been flagged by our fraud prevention checks. "
+            "Our investigation team will contact you shortly.",
+            [
+                "Provide original documentation for manual verification",
+                "Claim will be reviewed within 5 business days",
+            ],
+        )
+    
+    # MEDIUM risk always goes to manual review
+    if fraud_report["fraud_risk_level"] == "MEDIUM":
+        return _rule_decision(
+            "REQUIRES_REVIEW", "medium_risk",
+            "Manual review required: " + ("; ".join(fraud_report["risk_factors"]) or "medium fraud risk"),
+            "Section 5, Fraud Prevention Policy",
+            f"Risk level MEDIUM (score {fraud_report['risk_score']}/10).",
+            "Your claim needs a quick manual review by our claims team. "
+            "We will update you within 5 business days.",
+            [
+                "A claims officer will review your submission",
+                "Keep your original bills and prescriptions ready",
+            ],
+        )
+    
+    return None
+
+
+def record_decision_engine(engine: str):
+    with _decision_engine_lock:
+        _decision_engine_stats[engine] += 1
+
+
+def get_decision_engine_stats() -> dict:
+    """Fast-path hit ratio for /admin/api/stats."""
+    with _decision_engine_lock:
+        stats = dict(_decision_engine_stats)
+    total = stats["rules"] + stats["llm"]
+    stats["fast_path_ratio"] = round(stats["rules"] / total, 3) if total else None
+    return stats
+
+
+def process_claim_stream(claim_data: dict, bill_content: str, bill_info: dict, saved_file: Future = None):
     """Generator that yields SSE events as each processing stage completes."""
     
     def sse(stage: str, data: dict) -> str:
@@ -956,77 +3065,48 @@ def process_claim_stream(claim_data: dict, bill_content: str, bill_info: dict, f
             "progress": 55,
         })
         
-        # Stage 3: Retrieve policy context
-        approval_ctx = get_claim_approval_context()
-        exclusion_ctx = get_general_exclusion_context()
-        
-        yield sse("context_retrieved", {
-            "message": "Policy context loaded",
-            "progress": 65,
-        })
-        
-        # Stage 4: LLM Decision
-        yield sse("generating", {
-            "message": "AI is making decision...",
-            "progress": 70,
-        })
-        
-        risk_factors_str = "; ".join(fraud_report["risk_factors"]) if fraud_report["risk_factors"] else "None"
-        
-        # FIXED: Use improved prompt with examples
-        prompt = IMPROVED_DECISION_PROMPT.format(
-            patient_name=sanitize_for_llm(claim_data.get("patient_name", "")),
-            claim_type=sanitize_for_llm(claim_data.get("claim_type", "")),
-            disease=sanitize_for_llm(bill_info.get("disease", "Unknown")),
-            claimed_amount=sanitize_for_llm(claim_data.get("amount", 0)),
-            billed_amount=sanitize_for_llm(bill_info.get("expense") or "Unknown"),
-            date=sanitize_for_llm(claim_data.get("date", "")),
-            facility=sanitize_for_llm(claim_data.get("medical_facility", "")),
-            risk_level=sanitize_for_llm(fraud_report["fraud_risk_level"]),
-            risk_score=sanitize_for_llm(fraud_report["risk_score"]),
-            risk_factors=sanitize_for_llm(risk_factors_str),
-            policy_context=sanitize_for_llm(approval_ctx[:1500]),
-            exclusion_context=sanitize_for_llm(exclusion_ctx[:1000]),
-        )
-        
-        yield sse("keepalive", {
-            "message": "AI processing...",
-            "progress": 75,
-        })
-        
-        response = chat(
-            model=MAIN_MODEL,
-            messages=[
-                {"role": "system", "content": "You are an insurance claims adjudicator. Always respond with valid JSON only."},
-                {"role": "user", "content": prompt},
-            ],
-            options={"temperature": 0.3},
-        )
-        
-        llm_text = response["message"]["content"]
-        
-        json_match = re.search(r"\{[\s\S]*\}", llm_text)
-        if json_match:
-            try:
-                decision = json.loads(json_match.group())
-            except json.JSONDecodeError:
-                decision = _fallback_decision(llm_text, fraud_report)
+        # Clear-cut claims are settled by the rule engine without an LLM call
+        decision = apply_decision_rules(claim_data, bill_info, fraud_report)
+        if decision:
+            metrics = {"engine": "rules"}
+            logger.info(f"Claim {claim_data.get('id')} decided by rule '{decision['rule']}'")
         else:
-            decision = _fallback_decision(llm_text, fraud_report)
+            # Stage 3: Retrieve policy context
+            approval_ctx = get_claim_approval_context()
+            exclusion_ctx = get_general_exclusion_context()
+            
+            yield sse("context_retrieved", {
+                "message": "Policy context loaded",
+                "progress": 65,
+            })
+            
+            # Stage 4: LLM Decision
+            yield sse("generating", {
+                "message": "AI is making decision...",
+                "progress": 70,
+            })
+            
+            decision, metrics = yield from _stream_llm_decision(
+                sse, claim_data, bill_info, fraud_report, approval_ctx, exclusion_ctx
+            )
+            decision["decided_by"] = "llm"
+            metrics["engine"] = "llm"
+        record_decision_engine(decision["decided_by"])
         
         # Stage 5: Complete
         yield sse("decision", {
             "message": "Decision rendered",
             "decision": decision,
             "fraud_report": fraud_report,
+            "metrics": metrics,
             "progress": 95,
         })
         
-        # Save claim in background (file already saved before stream started)
+        # Save claim in background (waits for the audit-trail copy started before the stream)
         
         threading.Thread(
             target=_save_claim_with_logging,
-            args=(claim_data, bill_info, fraud_report, decision, file_path),
+            args=(claim_data, bill_info, fraud_report, decision, saved_file),
             daemon=True,
         ).start()
         
@@ -1040,6 +3120,68 @@ def process_claim_stream(claim_data: dict, bill_content: str, bill_info: dict, f
         yield sse("error", {"message": str(e)})
 
 
+def _stream_llm_decision(sse, claim_data: dict, bill_info: dict, fraud_report: dict,
+                         approval_ctx: str, exclusion_ctx: str):
+    """Sub-generator: streams decision tokens as SSE events, returns (decision, metrics)."""
+    # FIXED: Use improved prompt with examples, laid out as a cacheable static prefix
+    claim_ctx = get_claim_policy_context(bill_info.get("disease", ""), bill_info.get("icd10_code", ""))
+    messages = build_decision_messages(claim_data, bill_info, fraud_report, approval_ctx, exclusion_ctx, claim_ctx)
+    
+    # Stream tokens to the browser as they are generated
+    llm_started = time.perf_counter()
+    first_token_at = None
+    final_chunk = {}
+    parser = IncrementalJSONParser()
+    token_count = 0
+    
+    stream = ollama_chat(
+        model=MAIN_MODEL,
+        messages=messages,
+        format=DECISION_SCHEMA,
+        options={"temperature": 0.3},
+        keep_alive=DECISION_KEEP_ALIVE,
+        stream=True,
+    )
+    try:
+        for chunk in stream:
+            delta = chunk["message"]["content"]
+            if chunk.get("done"):
+                final_chunk = chunk
+            if not delta or parser.complete:
+                continue  # Keep reading to the final chunk for prefill stats
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            token_count += 1
+            fields = parser.feed(delta)
+            yield sse("decision_delta", {
+                "delta": delta,
+                "fields": fields,
+                "progress": min(90, 75 + token_count // 20),
+            })
+    finally:
+        if hasattr(stream, "close"):
+            stream.close()
+    
+    llm_text = parser.buffer
+    metrics = {
+        "ttft_ms": round((first_token_at - llm_started) * 1000) if first_token_at else None,
+        "total_ms": round((time.perf_counter() - llm_started) * 1000),
+        "tokens": final_chunk.get("eval_count") or token_count,
+        **record_prefill(messages, final_chunk),
+    }
+    logger.info(
+        f"Decision LLM: TTFT {metrics['ttft_ms']}ms, total {metrics['total_ms']}ms, "
+        f"{metrics['tokens']} tokens, prefill {metrics['prefill_tokens']}/~{metrics['prompt_tokens_est']} prompt tokens"
+    )
+    
+    try:
+        decision = validate_decision(parser.result)
+    except ValueError as e:
+        logger.warning(f"Decision output failed validation ({e}), using fallback")
+        decision = _fallback_decision(llm_text, fraud_report)
+    return decision, metrics
+
+
 def _fallback_decision(llm_text: str, fraud_report: dict) -> dict:
     """Build a fallback decision if LLM doesn't return valid JSON."""
     if llm_text and "ACCEPTED" in llm_text.upper():
@@ -1073,9 +3215,13 @@ def _fallback_decision(llm_text: str, fraud_report: dict) -> dict:
 # DATABASE SAVING (FIXED with transactions)
 # ============================================================================
 
-def _save_claim_with_logging(claim_data: dict, bill_info: dict, fraud_report: dict, decision: dict, file_path: str = None):
-    """Wrapper for save_claim that logs failures at CRITICAL level."""
+def _save_claim_with_logging(claim_data: dict, bill_info: dict, fraud_report: dict, decision: dict, saved_file: Future = None):
+    """
+    Wrapper for save_claim that logs failures at CRITICAL level.
+    file_path is recorded only once the upload write has finished; a failed write stores NULL.
+    """
     try:
+        file_path = saved_file.result() if saved_file else None
         save_claim(claim_data, bill_info, fraud_report, decision, file_path)
     except Exception as e:
         logger.critical(f"FAILED TO SAVE CLAIM: {e}", exc_info=True)
@@ -1086,6 +3232,15 @@ def save_claim(claim_data: dict, bill_info: dict, fraud_report: dict, decision:
     FIXED: Persist claim to SQLite with proper transaction handling.
     Both inserts succeed or both fail (atomic).
     """
+    # Embed before taking the write lock: a cache miss writes embedding_cache on its own connection
+    diagnosis = bill_info.get("disease", "")
+    vec = None
+    if diagnosis and sqlite_vec:
+        try:
+            vec = get_embedding(diagnosis.lower())
+        except Exception as e:
+            logger.warning(f"Could not embed claim diagnosis: {e}")
+    
     conn = None
     try:
         conn = sqlite3.connect(DB_PATH)
@@ -1104,8 +3259,9 @@ def save_claim(claim_data: dict, bill_info: dict, fraud_report: dict, decision:
             cursor.execute(
                 """INSERT OR REPLACE INTO claims
                 (id, patient_name, diagnosis, amount, date, medical_facility,
-                claim_type, claim_reason, status, risk_level, risk_score, file_path, icd10_code)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                claim_type, claim_reason, status, risk_level, risk_score, file_path, icd10_code,
+                decision_engine)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
                 (
                     claim_id,
                     claim_data.get("patient_name", ""),
@@ -1120,19 +3276,22 @@ def save_claim(claim_data: dict, bill_info: dict, fraud_report: dict, decision:
                     fraud_report.get("risk_score", 0),
                     file_path,
                     bill_info.get("icd10_code", ""),
+                    decision.get("decided_by", "llm"),
                 ),
             )
             
             # Insert vector
-            diagnosis = bill_info.get("disease", "")
-            if diagnosis and sqlite_vec:
+            if vec is not None:
                 try:
-                    resp = embed(model=EMBEDDING_MODEL, input=diagnosis.lower())
-                    vec = resp["embeddings"][0]
                     cursor.execute(
                         "INSERT OR REPLACE INTO claims_vec (claim_id, diagnosis_embedding) VALUES (?, ?)",
                         (claim_id, serialize_f32(vec)),
                     )
+                    if DUPLICATE_QUANTIZED_INDEX:
+                        cursor.execute(
+                            "INSERT OR REPLACE INTO claims_vec_q8 (claim_id, code) VALUES (?, ?)",
+                            (claim_id, quantize_int8(vec)),
+                        )
                 except Exception as e:
                     logger.warning(f"Could not store claim vector: {e}")
                     # Don't rollback for vector failure - claim is still valid
@@ -1195,16 +3354,20 @@ def health_check():
         logger.error(f"Health check DB error: {e}")
         health["status"] = "unhealthy"
     
+    health["startup"] = get_startup_report()
     try:
-        if get_faiss_db() is not None:
+        if _policy_manifest is None:
+            # Not built yet (warm-up still running): don't block the probe on it
+            health["status"] = "degraded"
+        elif get_faiss_db() is not None:
             health["faiss"] = True
         else:
-            if not os.path.exists(FAISS_PATH):
-                health["status"] = "degraded"
+            if not _policy_manifest.get("documents"):
+                health["status"] = "degraded"  # No policy PDFs indexed yet
             else:
                 health["status"] = "unhealthy"
     except Exception as e:
-        logger.error(f"Health check FAISS error: {e}")
+        logger.error(f"Health check policy index error: {e}")
         health["status"] = "unhealthy"
     
     status_code = 200 if health["status"] == "healthy" else (503 if health["status"] == "unhealthy" else 200)
@@ -1263,7 +3426,13 @@ def admin_stats():
                 "total_claims": total_claims,
                 "amount_saved": saved,
                 "statuses": statuses,
-                "top_diseases": top_diseases
+                "top_diseases": top_diseases,
+                "decision_prompt": get_prompt_stats(),
+                "decision_engine": get_decision_engine_stats(),
+                "embedding_batcher": get_embedding_batcher_stats(),
+                "embedding_cache": get_embedding_cache_stats(),
+                "policy_index_version": get_policy_index_version(),
+                "claim_policy_context": get_claim_context_stats(),
             })
     except Exception as e:
         logger.error(f"Stats error: {e}")
@@ -1316,8 +3485,7 @@ def add_exclusion():
         
         # Generate embedding for new exclusion
         text = f"{name}: {description}"
-        response = embed(model=EMBEDDING_MODEL, input=text)
-        vector = serialize_f32(response["embeddings"][0])
+        vector = serialize_f32(get_embedding(text))
         
         with get_db() as conn:
             cursor = conn.cursor()
@@ -1333,6 +3501,7 @@ def add_exclusion():
             )
             conn.commit()
         
+        refresh_exclusion_index()
         logger.info(f"Added exclusion: {name}")
         return jsonify({"success": True, "id": excl_id})
         
@@ -1350,6 +3519,7 @@ def delete_exclusion(id):
             cursor.execute("DELETE FROM exclusions_vec WHERE exclusion_id = ?", (id,))
             cursor.execute("DELETE FROM exclusions WHERE id = ?", (id,))
             conn.commit()
+        refresh_exclusion_index()
         logger.info(f"Deleted exclusion {id}")
         return jsonify({"success": True})
     except Exception as e:
@@ -1357,12 +3527,35 @@ def delete_exclusion(id):
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/admin/cache/extraction", methods=["DELETE"])
+def clear_extraction_cache():
+    """Invalidate cached bill extractions (e.g. after changing the extraction model)."""
+    try:
+        stale_only = request.args.get("stale_only", "").lower() in ("1", "true", "yes")
+        removed = invalidate_extraction_cache(stale_only=stale_only)
+        return jsonify({"success": True, "removed": removed})
+    except Exception as e:
+        logger.error(f"Extraction cache invalidation error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/admin/policy-index/sync", methods=["POST"])
+def sync_policy_index_route():
+    """Re-index changed policy PDFs now (force=1 rebuilds from scratch)."""
+    try:
+        force = request.args.get("force", "").lower() in ("1", "true", "yes")
+        return jsonify({"success": True, **sync_policy_index(force=force)})
+    except Exception as e:
+        logger.error(f"Policy index sync error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 # ============================================================================
 # FORM VALIDATION & PROCESSING
 # ============================================================================
 
 def validate_claim_form(request) -> tuple:
-    """Validate form data. Returns (is_valid, error_message, claim_data, safe_filename)."""
+    """Validate form data. Returns (is_valid, error_message, claim_data, safe_filename, upload)."""
     name = request.form.get("name", "").strip()
     address = request.form.get("address", "").strip()
     claim_type = request.form.get("claim_type", "").strip()
@@ -1374,25 +3567,25 @@ def validate_claim_form(request) -> tuple:
     medical_bill = request.files.get("medical_bill")
     
     if not all([name, claim_type, claim_reason, medical_bill, total_claim_amount]):
-        return False, "Please fill in all required fields", None, None
+        return False, "Please fill in all required fields", None, None, None
     
     try:
         amount = Decimal(total_claim_amount)
         if amount <= 0:
-            return False, "Claim amount must be greater than 0", None, None
+            return False, "Claim amount must be greater than 0", None, None, None
     except:
-        return False, "Claim amount must be a valid number", None, None
+        return False, "Claim amount must be a valid number", None, None, None
     
     if date:
         try:
             datetime.strptime(date, "%Y-%m-%d")
         except ValueError:
-            return False, "Date must be in YYYY-MM-DD format", None, None
+            return False, "Date must be in YYYY-MM-DD format", None, None, None
     
     # FIXED: Comprehensive file validation
-    is_valid, error_msg, safe_name = validate_uploaded_file(medical_bill)
+    is_valid, error_msg, safe_name, upload = validate_uploaded_file(medical_bill)
     if not is_valid:
-        return False, error_msg, None, None
+        return False, error_msg, None, None, None
     
     claim_data = {
         "patient_name": name,
@@ -1405,7 +3598,7 @@ def validate_claim_form(request) -> tuple:
         "description": description,
     }
     
-    return True, None, claim_data, safe_name
+    return True, None, claim_data, safe_name, upload
 
 
 @app.route("/process_claim", methods=["POST"])
@@ -1417,30 +3610,35 @@ def process_claim():
         if not status:
             return jsonify({"error": True, "message": message}), 503
         
-        is_valid, error_message, claim_data, safe_filename = validate_claim_form(request)
+        is_valid, error_message, claim_data, safe_filename, upload = validate_claim_form(request)
         if not is_valid:
             return jsonify({"error": True, "message": error_message}), 400
         
-        medical_bill = request.files.get("medical_bill")
         claim_data["id"] = f"CLM-{uuid.uuid4().hex[:12].upper()}"
+        content_hash = upload["content_hash"]
         
-        # FIX: Save file FIRST so Vision/OCR can read it directly from disk
-        file_path = save_uploaded_file(medical_bill, claim_data["id"], safe_filename)
-        
-        if not file_path:
-            return jsonify({"error": True, "message": "Failed to save file to disk."}), 500
+        # Audit-trail copy is written in the background; extraction works on the buffer
+        saved_file = save_uploaded_file(upload["data"], claim_data["id"], safe_filename)
+            
+        # Resubmissions/appeals of identical bytes skip OCR and LLM extraction
+        cached = get_cached_extraction(content_hash)
+        if cached:
+            bill_content, bill_info = cached
+            logger.info(f"Extraction cache hit for {content_hash[:12]}")
+        else:
+            # Extract bill text (with Vision or OCR if needed)
+            bill_content = get_file_content(upload)
+            if not bill_content:
+                return jsonify({"error": True, "message": f"Unable to read medical bill text. If this is an image, make sure {VISION_MODEL} is installed via Ollama."}), 400
             
-        # Extract bill text (with Vision or OCR if needed)
-        bill_content = get_file_content(file_path)
-        if not bill_content:
-            return jsonify({"error": True, "message": "Unable to read medical bill text. If this is an image, make sure llama3.2-vision is installed via Ollama."}), 400
+            bill_info = extract_bill_info(bill_content)
+            store_cached_extraction(content_hash, bill_content, bill_info)
         
-        bill_info = extract_bill_info(bill_content)
         claim_data["diagnosis"] = bill_info.get("disease", claim_data.get("claim_reason", ""))
         
-        # Pass file_path (string) not file object to the stream
+        # Pass the pending write (not the file object) to the stream
         return Response(
-            process_claim_stream(claim_data, bill_content, bill_info, file_path),
+            process_claim_stream(claim_data, bill_content, bill_info, saved_file),
             mimetype="text/event-stream",
             headers={
                 "Cache-Control": "no-cache",
@@ -1458,16 +3656,96 @@ def process_claim():
 # STARTUP
 # ============================================================================
 
+def _preload_heavy_modules():
+    """Import the lazily-loaded stacks so the first upload/index build doesn't pay for them."""
+    import PyPDF2  # noqa: F401
+    import langchain.text_splitter  # noqa: F401
+    import langchain_community.document_loaders  # noqa: F401
+    import langchain_core.documents  # noqa: F401
+    if PIL_AVAILABLE:
+        import PIL.Image  # noqa: F401
+    if OCR_AVAILABLE:
+        import pdf2image  # noqa: F401
+        import pytesseract  # noqa: F401
+
+
+def _warm_models():
+    """Load the decision and embedding models into Ollama so the first claim doesn't wait."""
+    status, message = check_ollama_status()
+    logger.info(f"Ollama Status: {message}")
+    if not status:
+        raise RuntimeError(message)
+    ollama_chat(model=MAIN_MODEL, messages=[], keep_alive=DECISION_KEEP_ALIVE)
+    ollama_embed(EMBEDDING_MODEL, ["warm-up"])
+
+
+def _wait_for_port(port: int, timeout: float = 30.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+
+def _run_warmup(port: Optional[int]):
+    if port is not None:
+        if _wait_for_port(port):
+            _startup_report["listening_ms"] = round((time.perf_counter() - _IMPORT_STARTED) * 1000)
+            logger.info(f"Accepting connections {_startup_report['listening_ms']} ms after import started")
+        else:
+            logger.warning(f"Port {port} not listening after 30s; warming up anyway")
+    
+    started = time.perf_counter()
+    for name, step in (
+        ("imports", _preload_heavy_modules),
+        ("policy_index", lambda: (get_faiss_db(), get_claim_approval_context(), get_general_exclusion_context())),
+        ("models", _warm_models),
+    ):
+        step_started = time.perf_counter()
+        try:
+            step()
+            _startup_report["warmup_ms"][name] = round((time.perf_counter() - step_started) * 1000)
+        except Exception as e:
+            _startup_report["warmup_ms"][name] = None
+            logger.warning(f"Warm-up step '{name}' failed: {e}")
+    _startup_report["warm"] = True
+    logger.info(
+        f"Warm-up finished in {(time.perf_counter() - started) * 1000:.0f} ms: {_startup_report['warmup_ms']}"
+    )
+
+
+def start_background_warmup(port: Optional[int] = None):
+    """
+    Warm the policy index, contexts, lazy imports and models on a daemon thread.
+    With `port`, waits until the server accepts connections first, so warm-up never
+    delays binding. Safe to call once per process (e.g. from a WSGI post-fork hook).
+    """
+    global _warmup_thread
+    with _warmup_lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=_run_warmup, args=(port,), name="warmup", daemon=True)
+            _warmup_thread.start()
+
+
+def get_startup_report() -> dict:
+    return {**_startup_report, "warmup_ms": dict(_startup_report["warmup_ms"])}
+
+
+_startup_report["import_ms"] = round((time.perf_counter() - _IMPORT_STARTED) * 1000)
+
+
 if __name__ == "__main__":
     print("=" * 60)
     print("ClaimTrackr — FIXED EDITION with OCR & Admin")
     print("=" * 60)
-    
-    status, message = check_ollama_status()
-    print(f"\nOllama Status: {message}")
+    print(f"\n[OK] Module imported in {_startup_report['import_ms']} ms")
     
     print("\nFeatures:")
     print(" ✓ OCR for scanned PDFs (Tesseract) - FIXED")
+    print(f" ✓ Parallel per-page OCR ({OCR_WORKERS} workers)")
     print(" ✓ File upload saving (audit trail)")
     print(" ✓ Admin UI for exclusions (/admin)")
     print(" ✓ Vector-based duplicate detection")
@@ -1478,17 +3756,12 @@ if __name__ == "__main__":
     print(" ✓ Improved LLM prompt with examples")
     print(" ✓ Rotating log files")
     print(" ✓ ICD-10 Medical Coding Support")
+    print(" ✓ Upload-hash extraction cache (resubmissions skip OCR/LLM)")
+    print(f" ✓ Embedding dimension: {EXPECTED_EMBEDDING_DIM}")
     
-    # Auto-migration for ICD-10 code
     try:
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute("PRAGMA table_info(claims)")
-            columns = [col["name"] for col in cursor.fetchall()]
-            if "icd10_code" not in columns:
-                cursor.execute("ALTER TABLE claims ADD COLUMN icd10_code TEXT")
-                conn.commit()
-                print(" [MIGRATION] Added icd10_code column to claims table")
+        run_migrations()
+        check_vector_schema()
     except Exception as e:
         logger.error(f"Migration error: {e}")
     
@@ -1499,8 +3772,10 @@ if __name__ == "__main__":
     
     print(f"\n[OK] Upload directory: {UPLOAD_DIR.absolute()}")
     
-    print("\nInitializing FAISS embeddings...")
-    get_faiss_db()
+    # Policy index, contexts and models warm up after the socket is bound (in the reloader child)
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_warmup(port=8081)
+    print("\nPolicy index, Ollama status and models: warming up in the background")
     
     print("\n" + "=" * 60)
     print("Starting server at: http://localhost:8081")
@@ -1,6 +1,8 @@
 # setup_db.py - Run this first to initialize the database
 # Usage: python setup_db.py
 
+import math
+import os
 import sqlite3
 import struct
 import sys
@@ -34,7 +36,18 @@ EXCLUSIONS = [
 ]
 
 EMBEDDING_MODEL = "nomic-embed-text"
-EXPECTED_EMBEDDING_DIM = 768
+EMBEDDING_NATIVE_DIM = 768
+# Must match the app: EMBEDDING_DIM=256 (or 512) stores truncated, renormalized vectors
+EXPECTED_EMBEDDING_DIM = int(os.environ.get("EMBEDDING_DIM", str(EMBEDDING_NATIVE_DIM)))
+
+
+def fit_embedding_dim(vector):
+    """Truncate to EXPECTED_EMBEDDING_DIM and L2-renormalize (Matryoshka embeddings)."""
+    if len(vector) <= EXPECTED_EMBEDDING_DIM:
+        return list(vector)
+    head = list(vector[:EXPECTED_EMBEDDING_DIM])
+    norm = math.sqrt(sum(x * x for x in head)) or 1.0
+    return [x / norm for x in head]
 
 
 def serialize_f32(vector):
@@ -67,6 +80,7 @@ def init_database():
         risk_score INTEGER,
         file_path TEXT,
         icd10_code TEXT,
+        decision_engine TEXT,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     )
     """)
@@ -75,12 +89,22 @@ def init_database():
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_claims_patient ON claims(patient_name)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_claims_date ON claims(date)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_claims_status ON claims(status)")
+    # Duplicate detection prefilter: same patient (case-insensitive) within a date window
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_claims_patient_lower_date ON claims(LOWER(patient_name), date)")
 
     # ── Claims vector table (for duplicate detection) ─────────────────
-    cursor.execute("""
+    cursor.execute(f"""
     CREATE VIRTUAL TABLE IF NOT EXISTS claims_vec USING vec0(
         claim_id TEXT PRIMARY KEY,
-        diagnosis_embedding float[768]
+        diagnosis_embedding float[{EXPECTED_EMBEDDING_DIM}]
+    )
+    """)
+
+    # ── Optional int8 codes for the coarse duplicate search ──────────
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS claims_vec_q8 (
+        claim_id TEXT PRIMARY KEY,
+        code BLOB NOT NULL
     )
     """)
 
@@ -94,10 +118,10 @@ def init_database():
     """)
 
     # ── Exclusions vector table (pre-computed embeddings) ─────────────
-    cursor.execute("""
+    cursor.execute(f"""
     CREATE VIRTUAL TABLE IF NOT EXISTS exclusions_vec USING vec0(
         exclusion_id INTEGER PRIMARY KEY,
-        embedding float[768]
+        embedding float[{EXPECTED_EMBEDDING_DIM}]
     )
     """)
 
@@ -110,6 +134,31 @@ def init_database():
     )
     """)
 
+    # ── Extraction cache (keyed by SHA-256 of uploaded bytes) ─────────
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS extraction_cache (
+        content_hash TEXT PRIMARY KEY,
+        extractor_version TEXT NOT NULL,
+        bill_text TEXT NOT NULL,
+        bill_info TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_extraction_cache_used ON extraction_cache(last_used_at)")
+
+    # ── Embedding cache (packed float32 vectors keyed by model + text) ─
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS embedding_cache (
+        model TEXT NOT NULL,
+        text TEXT NOT NULL,
+        vector BLOB NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (model, text)
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_embedding_cache_created ON embedding_cache(created_at)")
+
     conn.commit()
     print("[OK] Database tables created.")
     return conn
@@ -130,7 +179,7 @@ def precompute_exclusion_embeddings(conn):
 
         try:
             response = embed(model=EMBEDDING_MODEL, input=text)
-            vector = response["embeddings"][0]
+            vector = fit_embedding_dim(response["embeddings"][0])
             
             if len(vector) != EXPECTED_EMBEDDING_DIM:
                 print(f" [WARN] Unexpected embedding dimension for '{excl['name']}': {len(vector)}")
@@ -172,7 +221,7 @@ def main():
 
     cursor.execute("SELECT COUNT(*) FROM exclusions_vec")
     vec_count = cursor.fetchone()[0]
-    print(f"[VERIFY] Exclusion vectors: {vec_count}")
+    print(f"[VERIFY] Exclusion vectors: {vec_count} ({EXPECTED_EMBEDDING_DIM}-d)")
     
     cursor.execute("SELECT name FROM sqlite_master WHERE type='index' AND name LIKE 'idx_%'")
     indexes = [row[0] for row in cursor.fetchall()]